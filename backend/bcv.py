@@ -0,0 +1,27 @@
+"""
+BCV Module
+Parsing of the BCV (Banco Central de Venezuela) home page; no I/O, safe to import anywhere
+"""
+import re
+
+
+def parse_bcv_html(html_content: str):
+    """
+    Dollar rate from the BCV home page as (rate, source), or None.
+    """
+    # Pattern 1: Standard ID 'dolar' with strong tag (handling classes/attributes in strong)
+    match = re.search(r'id=["\']dolar["\'].*?strong[^>]*>\s*([\d,.]+)\s*<', html_content, re.DOTALL | re.IGNORECASE)
+
+    # Pattern 2: Search for USD text near a number
+    if not match:
+        match = re.search(r'USD.*?strong[^>]*>\s*([\d,.]+)\s*<', html_content, re.DOTALL | re.IGNORECASE)
+
+    if match:
+        return float(match.group(1).replace(',', '.')), "BCV Oficial (Scrape en Tiempo Real)"
+
+    # Pattern 3: Look for strong tags with rate-like values (50-1000 range for current BCV)
+    potentials = re.findall(r'strong[^>]*>\s*([\d]{1,4},[\d]+)\s*<', html_content)
+    if potentials:
+        # BCV order is EUR, CNY, TRY, RUB, USD (USD is usually last)
+        return float(potentials[-1].replace(',', '.')), "BCV Oficial (Scrape Directo)"
+    return None
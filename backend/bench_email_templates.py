@@ -0,0 +1,44 @@
+"""
+Microbenchmark: per-message email render cost for a large broadcast.
+Compares the classic path (template f-string + MIMEMultipart per recipient)
+with the precompiled CompiledEmail path used by broadcast jobs.
+
+Usage:
+    python bench_email_templates.py [recipients]
+"""
+import sys
+import time
+from email_service import email_service
+
+SUBJECT = "Novedades de Electromatics"
+MESSAGE = "Hola a todos,\nTenemos nuevos simuladores disponibles.\n¡Pruébalos hoy!"
+
+
+def classic(recipients):
+    for email, name in recipients:
+        html = email_service.get_electria_template(SUBJECT, MESSAGE.replace('\n', '<br>'), name)
+        email_service.build_message(email, SUBJECT, html).as_bytes()
+
+
+def compiled(recipients):
+    message = email_service.compile_broadcast(SUBJECT, MESSAGE)
+    for email, name in recipients:
+        message.as_bytes(email, name)
+
+
+def run(label, fn, recipients):
+    start = time.perf_counter()
+    fn(recipients)
+    elapsed = time.perf_counter() - start
+    per_message_us = elapsed / len(recipients) * 1e6
+    print(f"{label:<10} total {elapsed * 1000:8.1f} ms | {per_message_us:8.1f} µs/message")
+    return per_message_us
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    recipients = [(f"user{i}@example.com", f"Usuario {i}" if i % 3 else None) for i in range(count)]
+    print(f"Rendering {count} messages")
+    classic_us = run("classic", classic, recipients)
+    compiled_us = run("compiled", compiled, recipients)
+    print(f"Speedup: {classic_us / compiled_us:.1f}x")
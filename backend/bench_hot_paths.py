@@ -0,0 +1,225 @@
+"""
+Microbenchmarks for the per-request building blocks (password hashing, JWT, email template,
+CSV export rows, BCV scrape, UsersList serialization), pytest-benchmark style: each
+`bench_*` function receives a `benchmark` callable that calibrates and times its target.
+Every run is appended to a JSONL history and compared with the previous run.
+
+Usage:
+    python bench_hot_paths.py [-k filter] [--max-time 1.0] [--history bench_history.jsonl]
+                              [--compare-to N] [--no-save]
+"""
+import os
+import gc
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import statistics
+import subprocess
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.getenv("BENCH_HISTORY", os.path.join(BACKEND_DIR, "bench_history.jsonl"))
+# Each round runs enough iterations to last at least this long (timer resolution)
+MIN_ROUND_SECONDS = 0.005
+MIN_ROUNDS = 5
+# Median changes within this fraction are reported as unchanged
+CHANGE_THRESHOLD = 0.05
+
+PASSWORD = "Electromatics123!"
+EMAIL = "usuario@example.com"
+
+
+class Benchmark:
+    """The `benchmark` argument: benchmark(fn, *args) times fn and returns its result"""
+
+    def __init__(self, max_time: float):
+        self.max_time = max_time
+        self.stats = None
+
+    def _calibrate(self, fn, args) -> int:
+        iterations = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                fn(*args)
+            if time.perf_counter() - start >= MIN_ROUND_SECONDS or iterations >= 1_000_000:
+                return iterations
+            iterations *= 2
+
+    def __call__(self, fn, *args):
+        result = fn(*args)  # warm-up (imports, caches)
+        iterations = self._calibrate(fn, args)
+        rounds = []
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            deadline = time.perf_counter() + self.max_time
+            while len(rounds) < MIN_ROUNDS or time.perf_counter() < deadline:
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    fn(*args)
+                rounds.append((time.perf_counter() - start) / iterations)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self.stats = {
+            "min": min(rounds),
+            "median": statistics.median(rounds),
+            "mean": statistics.fmean(rounds),
+            "stddev": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+            "rounds": len(rounds),
+            "iterations": iterations,
+        }
+        return result
+
+
+# --- Benchmarks ----------------------------------------------------------------
+
+def bench_password_hash(benchmark):
+    import auth
+    benchmark(auth.get_password_hash, PASSWORD)
+
+
+def bench_password_verify(benchmark):
+    import auth
+    hashed = auth.get_password_hash(PASSWORD)
+    assert benchmark(auth.verify_password, PASSWORD, hashed)
+
+
+def bench_jwt_encode(benchmark):
+    import auth
+    benchmark(auth.create_access_token, {"sub": EMAIL}, timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+def bench_jwt_decode(benchmark):
+    import auth
+    token = auth.create_access_token({"sub": EMAIL}, timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES))
+    assert benchmark(auth.get_user_from_token, token) == EMAIL
+
+
+def bench_email_template(benchmark):
+    from email_service import email_service
+    content = "Tu cuenta ha sido verificada.<br>Ya puedes usar los simuladores de Electromatics."
+    benchmark(email_service.get_electria_template, "Bienvenido a Electromatics", content, "Usuario Prueba")
+
+
+def _user_rows(count: int) -> list:
+    now = datetime.utcnow()
+    return [
+        SimpleNamespace(
+            id=i, email=f"user{i}@example.com", full_name=f"Usuario {i}", created_at=now - timedelta(days=i % 365),
+            is_active=True, is_premium=i % 7 == 0, is_admin=i == 0, email_verified=i % 3 != 0, visit_count=i % 50,
+        )
+        for i in range(count)
+    ]
+
+
+def bench_export_csv_500_rows(benchmark):
+    import exports
+    rows = _user_rows(500)
+    benchmark(lambda: "".join(exports.iter_csv(rows)))
+
+
+def bench_bcv_scrape(benchmark):
+    import bcv
+    with open(os.path.join(BACKEND_DIR, "bcv_response.html"), encoding="utf-8", errors="replace") as f:
+        html = f.read()
+    assert benchmark(bcv.parse_bcv_html, html) is not None
+
+
+def bench_users_list_serialize(benchmark):
+    import schemas
+    users = _user_rows(20)
+
+    def serialize():
+        return schemas.UsersList.model_validate(
+            {"total": 1000, "skip": 0, "limit": 20, "next_cursor": 20, "users": users}, from_attributes=True
+        ).model_dump_json()
+
+    benchmark(serialize)
+
+
+# --- Runner --------------------------------------------------------------------
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def load_history(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_result(history: list, name: str, n: int):
+    """Stats of `name` from the Nth most recent run that included it (runs may be filtered with -k)"""
+    runs = [entry["results"][name] for entry in history if name in entry["results"]]
+    return runs[-n] if len(runs) >= n else None
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def format_change(current: float, previous: float) -> str:
+    change = current / previous - 1
+    if abs(change) < CHANGE_THRESHOLD:
+        return f"{change:+.1%} (=)"
+    return f"{change:+.1%} ({'slower' if change > 0 else 'faster'})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for backend hot functions")
+    parser.add_argument("-k", dest="filter", help="only benchmarks whose name contains this")
+    parser.add_argument("--max-time", type=float, default=1.0, help="seconds of timed rounds per benchmark")
+    parser.add_argument("--history", default=HISTORY_FILE, help="JSONL file the results are appended to")
+    parser.add_argument("--compare-to", type=int, default=1, help="compare with the Nth previous run of each benchmark")
+    parser.add_argument("--no-save", action="store_true", help="do not append this run to the history")
+    args = parser.parse_args()
+
+    benchmarks = [(name[len("bench_"):], fn) for name, fn in globals().items()
+                  if name.startswith("bench_") and callable(fn)]
+    if args.filter:
+        benchmarks = [(name, fn) for name, fn in benchmarks if args.filter in name]
+
+    history = load_history(args.history)
+    results = {}
+
+    print(f"{'benchmark':<28} {'min':>10} {'median':>10} {'mean':>10} {'stddev':>10} {'ops/s':>12} {'rounds':>7}  vs previous")
+    for name, fn in benchmarks:
+        benchmark = Benchmark(args.max_time)
+        fn(benchmark)
+        stats = benchmark.stats
+        results[name] = stats
+        previous = previous_result(history, name, args.compare_to)
+        change = format_change(stats["median"], previous["median"]) if previous else "-"
+        print(f"{name:<28} {format_time(stats['min']):>10} {format_time(stats['median']):>10} "
+              f"{format_time(stats['mean']):>10} {format_time(stats['stddev']):>10} "
+              f"{1 / stats['median']:>12,.0f} {stats['rounds']:>7}  {change}")
+
+    if not args.no_save and results:
+        entry = {
+            "created_at": datetime.utcnow().isoformat(),
+            "commit": git_commit(),
+            "machine": {"host": socket.gethostname(), "python": platform.python_version(), "platform": platform.platform()},
+            "results": results,
+        }
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"\nRun {len(history) + 1} appended to {args.history} (commit {entry['commit']})")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Benchmark: requests/second through the legacy @app.middleware("http") CORS shim
+versus the pure ASGI middleware stack in middleware.py.
+Requests are driven in-process (no sockets) so only the framework path is measured.
+
+Usage:
+    python bench_middleware.py [requests]
+"""
+import sys
+import time
+import asyncio
+from fastapi import FastAPI, Request, Response
+from middleware import CORSMiddleware, CompressionMiddleware
+
+PAYLOAD = {"users": [{"id": i, "email": f"user{i}@example.com", "full_name": f"Usuario {i}"} for i in range(20)]}
+
+
+def legacy_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def cors_middleware(request: Request, call_next):
+        if request.method == "OPTIONS":
+            return Response(status_code=204, headers={
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "*",
+                "Access-Control-Allow-Headers": "*",
+            })
+        response = await call_next(request)
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        response.headers["Access-Control-Allow-Methods"] = "*"
+        response.headers["Access-Control-Allow-Headers"] = "*"
+        return response
+
+    @app.get("/data")
+    async def data():
+        return PAYLOAD
+
+    return app
+
+
+def asgi_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(CORSMiddleware)
+
+    @app.get("/data")
+    async def data():
+        return PAYLOAD
+
+    return app
+
+
+async def call(app, method: str, path: str):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def measure(app, method: str, count: int) -> float:
+    # Warm-up (route compilation, lifespan-free startup)
+    for _ in range(200):
+        await call(app, method, "/data")
+    start = time.perf_counter()
+    for _ in range(count):
+        await call(app, method, "/data")
+    return count / (time.perf_counter() - start)
+
+
+async def main(count: int):
+    for method in ("GET", "OPTIONS"):
+        before = await measure(legacy_app(), method, count)
+        after = await measure(asgi_app(), method, count)
+        print(f"{method:<8} legacy {before:9.0f} req/s | asgi {after:9.0f} req/s | {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
@@ -0,0 +1,146 @@
+"""
+Broadcast Jobs Module
+Runs admin broadcasts in the background over a pool of reused SMTP sessions
+"""
+import os
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+import models, database
+from email_service import email_service, SMTPConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Concurrent SMTP sessions per broadcast (Gmail tolerates only a handful)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "3"))
+BROADCAST_YIELD_PER = 500
+# Finished jobs kept in memory for the status endpoint
+MAX_TRACKED_JOBS = 50
+
+
+def recipients_query(db, target: str):
+    """Users addressed by a broadcast target ('all', 'premium', 'admin')"""
+    query = db.query(models.User.email, models.User.full_name)
+    if target == 'premium':
+        query = query.filter(models.User.is_premium == True)
+    elif target == 'admin':
+        query = query.filter(models.User.is_admin == True)
+    return query
+
+
+class BroadcastJob:
+    """Progress of a single broadcast"""
+
+    def __init__(self, subject: str, message: str, target: str, total: int):
+        self.id = uuid.uuid4().hex
+        self.subject = subject
+        self.message = message
+        self.target = target
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.failed_recipients = []
+        self.status = "queued"
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def record(self, email: str, ok: bool):
+        with self._lock:
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+                if len(self.failed_recipients) < 100:
+                    self.failed_recipients.append(email)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "subject": self.subject,
+                "target": self.target,
+                "total": self.total,
+                "sent": self.sent,
+                "failed": self.failed,
+                "pending": max(self.total - self.sent - self.failed, 0),
+                "failed_recipients": list(self.failed_recipients),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class BroadcastJobManager:
+    """Queues broadcasts and runs them one at a time on a background thread"""
+
+    def __init__(self, concurrency: int = BROADCAST_CONCURRENCY):
+        self.concurrency = concurrency
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="broadcast-job")
+
+    def submit(self, subject: str, message: str, target: str, total: int) -> BroadcastJob:
+        job = BroadcastJob(subject, message, target, total)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > MAX_TRACKED_JOBS:
+                self._jobs.popitem(last=False)
+        self._runner.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[BroadcastJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def _run(self, job: BroadcastJob):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        logger.info("📣 Broadcast %s started for %s users", job.id, job.total)
+
+        pool = SMTPConnectionPool(email_service, size=self.concurrency)
+        # Bounds queued sends so recipients are streamed, not all loaded at once
+        in_flight = threading.BoundedSemaphore(self.concurrency * 2)
+        db = database.SessionLocal()
+        # Rendered and encoded once; each recipient only adds To + greeting
+        compiled = email_service.compile_broadcast(job.subject, job.message)
+
+        def send(email, full_name):
+            try:
+                ok = email_service.send_compiled(compiled, email, full_name, pool=pool)
+                job.record(email, ok)
+            finally:
+                in_flight.release()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="broadcast-smtp") as senders:
+                recipients = recipients_query(db, job.target).execution_options(yield_per=BROADCAST_YIELD_PER)
+                for email, full_name in recipients:
+                    in_flight.acquire()
+                    senders.submit(send, email, full_name)
+            job.status = "completed"
+        except Exception as e:
+            job.status = "failed"
+            logger.error("❌ Broadcast %s failed: %s", job.id, e)
+        finally:
+            db.close()
+            pool.close()
+            job.finished_at = datetime.utcnow()
+            logger.info("📣 Broadcast %s %s: %s sent, %s failed", job.id, job.status, job.sent, job.failed)
+
+    def shutdown(self):
+        self._runner.shutdown(wait=False, cancel_futures=True)
+
+
+# Global broadcast job manager
+broadcast_jobs = BroadcastJobManager()
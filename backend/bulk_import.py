@@ -0,0 +1,200 @@
+"""
+Bulk Import Module
+Parses CSV / NDJSON user lists, hashes passwords in parallel and inserts in batches
+"""
+import io
+import os
+import csv
+import json
+import logging
+import threading
+import multiprocessing
+from datetime import datetime
+from sqlalchemy import insert, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models, auth
+from db_writer import db_writer
+
+logger = logging.getLogger(__name__)
+
+IMPORT_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", "10000"))
+IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "1000"))
+HASH_WORKERS = int(os.getenv("BULK_IMPORT_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+# Existing-email lookups are chunked to stay under driver parameter limits
+EMAIL_LOOKUP_CHUNK = 5000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ImportFormatError(ValueError):
+    """Raised when the uploaded payload cannot be parsed"""
+
+
+def get_executor():
+    """Process pool shared by all imports (created on first use)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn, not fork: the server runs background threads (log writer,
+            # db writer, outbox, counters) whose locks a forked child would inherit
+            _executor = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def parse_records(payload: str, fmt: str) -> list:
+    """Returns a list of dicts with (at least) email / password / full_name keys"""
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(payload))
+        if not reader.fieldnames:
+            return []
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        return list(reader)
+
+    if fmt == "ndjson":
+        records = []
+        for line_number, line in enumerate(payload.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ImportFormatError(f"Line {line_number}: invalid JSON ({e.msg})")
+            if not isinstance(record, dict):
+                raise ImportFormatError(f"Line {line_number}: expected a JSON object")
+            records.append(record)
+        return records
+
+    raise ImportFormatError("Unsupported format. Use 'csv' or 'ndjson'")
+
+
+def hash_passwords(passwords: list) -> list:
+    """Hashes passwords across CPU cores (inline for tiny inputs)"""
+    if len(passwords) < 2 or HASH_WORKERS < 2:
+        return [auth.get_password_hash(p) for p in passwords]
+    chunksize = max(1, len(passwords) // (HASH_WORKERS * 4))
+    return list(get_executor().map(auth.get_password_hash, passwords, chunksize=chunksize))
+
+
+def find_existing_emails(db: Session, emails: list) -> set:
+    """Lower-cased `emails` already registered, compared case-insensitively"""
+    existing = set()
+    for i in range(0, len(emails), EMAIL_LOOKUP_CHUNK):
+        chunk = emails[i:i + EMAIL_LOOKUP_CHUNK]
+        existing.update(
+            email.lower()
+            for (email,) in db.query(models.User.email).filter(func.lower(models.User.email).in_(chunk))
+        )
+    return existing
+
+
+def insert_users(db: Session, rows: list) -> set:
+    """
+    Inserts `rows` with batched INSERTs in one transaction and returns the
+    emails that could not be inserted. Emails registered (in any case) since
+    they were checked are skipped; if an insert still hits the unique
+    constraint (IntegrityError), the batch is rolled back and the rows are
+    inserted one by one, skipping the taken ones.
+    """
+    existing = find_existing_emails(db, [row["email"].lower() for row in rows])
+    taken = {row["email"] for row in rows if row["email"].lower() in existing}
+    rows = [row for row in rows if row["email"] not in taken]
+    try:
+        for i in range(0, len(rows), IMPORT_BATCH_SIZE):
+            db.execute(insert(models.User), rows[i:i + IMPORT_BATCH_SIZE])
+        db.commit()
+        return taken
+    except IntegrityError:
+        db.rollback()
+
+    for row in rows:
+        try:
+            db.execute(insert(models.User), [row])
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            taken.add(row["email"])
+    logger.warning("📥 Bulk import: %s emails were registered concurrently, inserted row by row", len(taken))
+    return taken
+
+
+def import_users(db: Session, records: list) -> dict:
+    """
+    Creates users from parsed records and returns a per-row report.
+    Emails are stored as given (the address users log in with) but compared
+    case-insensitively: rows are validated, de-duplicated (within the file and
+    against the database), hashed in parallel and inserted with insert_users()
+    by the serialized writer.
+    """
+    report = [None] * len(records)
+    candidates = []
+    seen = set()
+
+    for index, record in enumerate(records):
+        email = str(record.get("email") or "").strip()
+        password = record.get("password")
+        if not email or "@" not in email:
+            report[index] = {"row": index + 1, "email": email or None, "status": "invalid", "detail": "Missing or invalid email"}
+        elif not password:
+            report[index] = {"row": index + 1, "email": email, "status": "invalid", "detail": "Missing password"}
+        elif email.lower() in seen:
+            report[index] = {"row": index + 1, "email": email, "status": "duplicate", "detail": "Repeated in file"}
+        else:
+            seen.add(email.lower())
+            candidates.append((index, email, str(password), record.get("full_name") or None))
+
+    existing = find_existing_emails(db, [email.lower() for _, email, _, _ in candidates])
+    to_create = []
+    for index, email, password, full_name in candidates:
+        if email.lower() in existing:
+            report[index] = {"row": index + 1, "email": email, "status": "duplicate", "detail": "Email already registered"}
+        else:
+            to_create.append((index, email, password, full_name))
+
+    hashes = hash_passwords([password for _, _, password, _ in to_create])
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "email": email,
+            "hashed_password": hashed,
+            "full_name": full_name,
+            "is_active": True,
+            "is_premium": True,  # BETA: Free Premium for everyone
+            "is_admin": False,
+            "email_verified": True,  # BETA: Auto-verified to allow immediate login
+            "visit_count": 0,
+            "created_at": now,
+        }
+        for (_, email, _, full_name), hashed in zip(to_create, hashes)
+    ]
+    taken = db_writer.run_as(db, insert_users, rows)
+
+    for index, email, _, _ in to_create:
+        if email in taken:
+            report[index] = {"row": index + 1, "email": email, "status": "duplicate", "detail": "Email already registered"}
+        else:
+            report[index] = {"row": index + 1, "email": email, "status": "created", "detail": None}
+
+    created = len(rows) - len(taken)
+    logger.info("📥 Bulk import: %s created of %s rows", created, len(records))
+    return {
+        "total": len(records),
+        "created": created,
+        "duplicates": sum(1 for r in report if r["status"] == "duplicate"),
+        "invalid": sum(1 for r in report if r["status"] == "invalid"),
+        "rows": report,
+    }
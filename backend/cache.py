@@ -0,0 +1,303 @@
+"""
+Cache Module
+Thread-safe TTL caches and payload version counters: in-process, or shared by the workers
+on this host (SQLite WAL store, see shared_cache.py) behind an in-process L1
+"""
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+import metrics
+from shared_cache import shared_store, as_stored
+
+logger = logging.getLogger(__name__)
+
+# 'local' (per process) or 'sqlite' (shared by every worker on the host)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local").lower()
+# How long a worker may serve its own copy of a shared entry; bounds how late
+# it sees another worker's delete / clear
+L1_TTL_SECONDS = float(os.getenv("CACHE_L1_TTL_SECONDS", "2"))
+STORE_ERROR_LOG_INTERVAL = 60
+
+_MISSING = object()
+
+# Named caches, reported by the metrics endpoint
+named_caches = {}
+
+
+class TTLCache:
+    """
+    LRU cache whose entries expire after `ttl` seconds.
+    Caches created with a `name` are listed in `named_caches` (hit/miss metrics).
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 1024, name: str = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        if name:
+            named_caches[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __len__(self):
+        return len(self._data)
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl: float = None):
+        """Return the cached value for `key`, computing it with `factory()` on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def compare_and_set(self, key, expected, value, ttl: float = None) -> bool:
+        """Set `value` only if the current value equals `expected` (None: key absent)"""
+        with self._lock:
+            entry = self._data.get(key)
+            current = entry[0] if entry is not None and entry[1] >= time.monotonic() else None
+            if current != expected:
+                return False
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_last_store_error_log = 0.0
+
+
+def _store_failed(error: Exception):
+    """Shared store errors degrade to local-only caching (logged at most once a minute)"""
+    global _last_store_error_log
+    shared_store.note_error()
+    if time.monotonic() - _last_store_error_log >= STORE_ERROR_LOG_INTERVAL:
+        _last_store_error_log = time.monotonic()
+        logger.warning("⚠️ Shared cache unavailable (%s): %s", shared_store.path, error)
+
+
+class TieredCache:
+    """
+    TTLCache interface over the shared store, with an in-process L1 holding
+    entries for at most L1_TTL_SECONDS. Values must be JSON-serializable, and
+    both tiers return them as the store does (JSON round trip: tuples come
+    back as lists). Misses always consult the store, so another worker's set
+    is seen at once.
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 1024, name: str = None):
+        if not name:
+            raise ValueError("A shared cache needs a name (its namespace in the store)")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._l1 = TTLCache(ttl=min(ttl, L1_TTL_SECONDS), max_entries=max_entries)
+        named_caches[name] = self
+
+    def get(self, key, default=None):
+        value = self._l1.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        try:
+            entry = shared_store.get(self.name, key)
+        except sqlite3.Error as e:
+            _store_failed(e)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        remaining = L1_TTL_SECONDS if expires_at is None else expires_at - time.time()
+        self._l1.set(key, value, ttl=min(L1_TTL_SECONDS, remaining))
+        self.hits += 1
+        return value
+
+    def __len__(self):
+        return len(self._l1)
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            shared_store.set(self.name, key, value, ttl, self.max_entries)
+        except sqlite3.Error as e:
+            _store_failed(e)
+        self._l1.set(key, as_stored(value), ttl=min(ttl, L1_TTL_SECONDS))
+
+    def get_or_set(self, key, factory, ttl: float = None):
+        """Return the cached value for `key`, computing it with `factory()` on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = as_stored(factory())
+            self.set(key, value, ttl)
+        return value
+
+    def compare_and_set(self, key, expected, value, ttl: float = None) -> bool:
+        """Atomic across workers: set `value` only if the shared value equals `expected` (None: absent)"""
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            swapped = shared_store.compare_and_set(self.name, key, expected, value, ttl, self.max_entries)
+        except sqlite3.Error as e:
+            _store_failed(e)
+            return False
+        if swapped:
+            self._l1.set(key, as_stored(value), ttl=min(ttl, L1_TTL_SECONDS))
+        else:
+            self._l1.delete(key)
+        return swapped
+
+    def delete(self, key):
+        self._l1.delete(key)
+        try:
+            shared_store.delete(self.name, key)
+        except sqlite3.Error as e:
+            _store_failed(e)
+
+    def clear(self):
+        self._l1.clear()
+        try:
+            shared_store.clear(self.name)
+        except sqlite3.Error as e:
+            _store_failed(e)
+
+
+def make_cache(ttl: float = 30, max_entries: int = 1024, name: str = None):
+    """Cache for `name` on the configured backend (CACHE_BACKEND); unnamed caches stay local"""
+    if CACHE_BACKEND == "sqlite" and name:
+        return TieredCache(ttl=ttl, max_entries=max_entries, name=name)
+    return TTLCache(ttl=ttl, max_entries=max_entries, name=name)
+
+
+class VersionStore:
+    """
+    Named payload versions. Writers bump a name when the data behind it changes;
+    readers use the current value to build validators such as ETags.
+    A version bumped with a ttl expires, after which `get` returns None.
+    Versions are per process, so the epoch (which validators must include)
+    is a per-process id: versions issued by another worker or before a
+    restart never match.
+    """
+
+    def __init__(self):
+        self.epoch_id = uuid.uuid4().hex
+        self._versions = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def bump(self, name: str, ttl: float = None) -> int:
+        with self._lock:
+            self._counter += 1
+            expires_at = time.monotonic() + ttl if ttl is not None else None
+            self._versions[name] = (self._counter, expires_at)
+            return self._counter
+
+    def epoch(self) -> str:
+        return self.epoch_id
+
+    def get(self, name: str):
+        with self._lock:
+            entry = self._versions.get(name)
+            if entry is None:
+                return None
+            version, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._versions[name]
+                return None
+            return version
+
+
+class SharedVersionStore:
+    """
+    VersionStore interface on the shared store, so every worker issues the
+    same versions. A name whose bump failed reads as None in this process
+    (no ETag, so no stale 304) until a later bump succeeds. The epoch is
+    the store's own, so every worker validates the others' ETags.
+    """
+
+    def __init__(self):
+        self._failed = set()
+
+    def bump(self, name: str, ttl: float = None):
+        try:
+            version = shared_store.bump_version(name, ttl)
+        except sqlite3.Error as e:
+            _store_failed(e)
+            self._failed.add(name)
+            return None
+        self._failed.discard(name)
+        return version
+
+    def epoch(self):
+        """Store-wide epoch, or None if the store cannot be read"""
+        try:
+            return str(shared_store.epoch())
+        except sqlite3.Error as e:
+            _store_failed(e)
+            return None
+
+    def get(self, name: str):
+        if name in self._failed:
+            return None
+        try:
+            return shared_store.version(name)
+        except sqlite3.Error as e:
+            _store_failed(e)
+            return None
+
+
+def collect_metrics():
+    """Hit / miss counters and sizes of the named caches (hit ratio = hits / (hits + misses))"""
+    caches = list(named_caches.items())
+    yield "cache_hits", "counter", "Cache hits (L1 or shared store)", [
+        ("_total", {"cache": name}, cache.hits) for name, cache in caches
+    ]
+    yield "cache_misses", "counter", "Cache misses (neither L1 nor shared store)", [
+        ("_total", {"cache": name}, cache.misses) for name, cache in caches
+    ]
+    yield "cache_entries", "gauge", "Entries currently held in process", [
+        ("", {"cache": name}, len(cache)) for name, cache in caches
+    ]
+
+
+metrics.registry.add_collector(collect_metrics)
+
+# Versions of cacheable payloads ('users', 'visits', 'bcv', 'config')
+payload_versions = SharedVersionStore() if CACHE_BACKEND == "sqlite" else VersionStore()
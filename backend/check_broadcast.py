@@ -0,0 +1,89 @@
+"""
+Broadcast Check Script
+Runs a broadcast through BroadcastJobManager against the local SMTP sink and verifies
+the job's sent / failed counts, the messages the sink received and that SMTP sessions
+were reused instead of opened per recipient.
+Usage: python check_broadcast.py [--recipients 301] [--rejected 3] [--concurrency 3]
+Runs in a temporary directory with its own SQLite file; exits with status 1 on a mismatch.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+JOB_TIMEOUT_SECONDS = 120
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=301)
+    parser.add_argument("--rejected", type=int, default=3, help="recipients the sink refuses")
+    parser.add_argument("--concurrency", type=int, default=3)
+    return parser.parse_args()
+
+
+def check_broadcast(args) -> bool:
+    from smtp_sink import SMTPSink
+
+    sink = SMTPSink(port=0, reject=[f"rejected{i}@example.com" for i in range(args.rejected)])
+    sink.start_background()
+    # Before the backend modules are imported: they read these at import time.
+    # Empty (not unset) so a .env file cannot point the check at a real database / SMTP server
+    os.environ.update(
+        DATABASE_URL="",
+        SMTP_SERVER="127.0.0.1",
+        SMTP_PORT=str(sink.server_address[1]),
+        SMTP_STARTTLS="false",
+        SMTP_PASSWORD="sink",
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+    )
+    os.chdir(tempfile.mkdtemp(prefix="check_broadcast_"))
+    import database
+    import models
+    from broadcast_jobs import BroadcastJobManager, recipients_query
+
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    accepted = args.recipients - args.rejected
+    db.add_all(
+        [models.User(email=f"user{i}@example.com", full_name=f"User {i}") for i in range(accepted)]
+        + [models.User(email=email, full_name="Rejected") for email in sink.reject]
+    )
+    db.commit()
+    total = recipients_query(db, "all").count()
+    db.close()
+
+    manager = BroadcastJobManager(concurrency=args.concurrency)
+    started = time.perf_counter()
+    job = manager.submit("Check", "Broadcast check", "all", total)
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while job.finished_at is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    manager.shutdown()
+    sink.shutdown()
+
+    stats = sink.stats
+    # A refused recipient makes the pool discard that session, so each one costs a reconnect
+    max_connections = args.concurrency + args.rejected
+    checks = [
+        (f"job completed ({job.status})", job.status == "completed"),
+        (f"sent {job.sent} == {accepted}", job.sent == accepted),
+        (f"failed {job.failed} == {args.rejected}", job.failed == args.rejected),
+        ("failed recipients are the rejected ones", set(job.failed_recipients) == sink.reject),
+        (f"sink received {stats.messages} == {accepted} messages", stats.messages == accepted),
+        (f"{stats.connections} SMTP connections <= {max_connections} (sessions reused)",
+         0 < stats.connections <= max_connections),
+        (f"{stats.logins} logins == {stats.connections} connections", stats.logins == stats.connections),
+    ]
+    print(f"Broadcast to {total} recipients in {elapsed:.2f}s ({args.concurrency} SMTP sessions)")
+    for description, ok in checks:
+        print(f"{'OK  ' if ok else 'MISS'} {description}")
+    return all(ok for _, ok in checks)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, BACKEND_DIR)
+    sys.exit(0 if check_broadcast(parse_args()) else 1)
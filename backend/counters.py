@@ -0,0 +1,99 @@
+"""
+Visit Counter Module
+Aggregates users.visit_count increments in memory and flushes them in batches
+"""
+import os
+import threading
+import logging
+from collections import defaultdict
+from sqlalchemy import update, func
+import models
+from cache import payload_versions
+from db_writer import db_writer
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = float(os.getenv("VISIT_COUNTER_FLUSH_SECONDS", "5"))
+FLUSH_BATCH_SIZE = int(os.getenv("VISIT_COUNTER_BATCH_SIZE", "500"))
+
+
+class VisitCounter:
+    """
+    Buffers visit_count increments per user so hot paths never write.
+    A background thread flushes them with atomic
+    `UPDATE users SET visit_count = visit_count + n WHERE id IN (...)` statements,
+    run by the serialized writer.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL_SECONDS, batch_size: int = FLUSH_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def increment(self, user_id: int, amount: int = 1):
+        """Record increments for a user (no database access)"""
+        with self._lock:
+            self._pending[user_id] += amount
+
+    def flush(self) -> int:
+        """Write all buffered increments. Returns the number of users updated."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, self._pending = self._pending, defaultdict(int)
+
+            # Group users by increment so each batch is a single UPDATE ... WHERE id IN (...)
+            by_amount = defaultdict(list)
+            for user_id, amount in pending.items():
+                by_amount[amount].append(user_id)
+
+            try:
+                db_writer.run(self._write, by_amount)
+            except Exception as e:
+                # Put the increments back so the next flush retries them
+                with self._lock:
+                    for user_id, amount in pending.items():
+                        self._pending[user_id] += amount
+                logger.error("❌ Failed to flush visit counters: %s", e)
+                return 0
+
+            payload_versions.bump("users")
+            return len(pending)
+
+    def _write(self, db, by_amount: dict):
+        for amount, user_ids in by_amount.items():
+            for i in range(0, len(user_ids), self.batch_size):
+                db.execute(
+                    update(models.User)
+                    .where(models.User.id.in_(user_ids[i:i + self.batch_size]))
+                    .values(visit_count=func.coalesce(models.User.visit_count, 0) + amount)
+                )
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """Start the background flusher thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="visit-counter-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still buffered"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+
+# Global visit counter instance
+visit_counter = VisitCounter()
@@ -1,10 +1,40 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from fastapi import Request
 import os
+import pool_telemetry
+import tracing
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Named pool profiles, selected with DB_POOL_PROFILE. DB_POOL_SIZE,
+# DB_POOL_MAX_OVERFLOW and DB_POOL_TIMEOUT override single values.
+POOL_PROFILES = {
+    # Few server connections (shared hosting limits), long wait
+    "default": {"pool_size": 3, "max_overflow": 0, "pool_timeout": 30, "pool_recycle": 1800},
+    # Same steady state, extra connections for bursts, fail fast instead of queueing
+    "burst": {"pool_size": 3, "max_overflow": 7, "pool_timeout": 5, "pool_recycle": 1800, "pool_use_lifo": True},
+    # PgBouncer in transaction mode: client connections to the bouncer are cheap,
+    # server state is not kept between transactions (no prepared statements)
+    "pgbouncer": {"pool_size": 10, "max_overflow": 20, "pool_timeout": 5, "pool_recycle": 300, "transaction_pooling": True},
+}
+POOL_PROFILE_NAME = os.getenv("DB_POOL_PROFILE", "default").lower()
+if POOL_PROFILE_NAME not in POOL_PROFILES:
+    print(f"DATABASE: Unknown DB_POOL_PROFILE '{POOL_PROFILE_NAME}', using 'default'")
+    POOL_PROFILE_NAME = "default"
+POOL_PROFILE = dict(POOL_PROFILES[POOL_PROFILE_NAME])
+for env_name, key, cast in (
+    ("DB_POOL_SIZE", "pool_size", int),
+    ("DB_POOL_MAX_OVERFLOW", "max_overflow", int),
+    ("DB_POOL_TIMEOUT", "pool_timeout", float),
+):
+    if os.getenv(env_name):
+        POOL_PROFILE[key] = cast(os.getenv(env_name))
+# Session-level state (advisory locks, prepared statements) is unsafe behind a transaction pooler
+TRANSACTION_POOLING = POOL_PROFILE.pop("transaction_pooling", False)
+
 if DATABASE_URL:
     # 1. Corregir esquema para SQLAlchemy
     if DATABASE_URL.startswith("postgres://"):
@@ -26,7 +56,11 @@ if DATABASE_URL:
     
     # Determinar sslmode basado en el host
     # heroweb.top no soporta SSL, otros servidores PostgreSQL pueden requerirlo
-    if "heroweb" in DATABASE_URL.lower():
+    # DB_SSLMODE overrides it (e.g. "disable" for a local PostgreSQL in load tests)
+    if os.getenv("DB_SSLMODE"):
+        ssl_mode = os.getenv("DB_SSLMODE")
+        print(f"DATABASE: sslmode={ssl_mode} (DB_SSLMODE)")
+    elif "heroweb" in DATABASE_URL.lower():
         ssl_mode = "disable"
         print("DATABASE: SSL disabled (heroweb.top does not support SSL)")
     else:
@@ -38,30 +72,123 @@ if DATABASE_URL:
         "connect_timeout": 30
     }
     # No añadimos prep_threshold a connect_args ya que psycopg2 no lo soporta
+    # (psycopg2 never prepares server-side; psycopg 3 does unless disabled)
+    if TRANSACTION_POOLING and make_url(DATABASE_URL).get_dialect().driver == "psycopg":
+        connect_args["prepare_threshold"] = None
 
-    print(f"DATABASE: Connecting to PostgreSQL")
+    print(f"DATABASE: Connecting to PostgreSQL (pool profile '{POOL_PROFILE_NAME}')")
     engine = create_engine(
         DATABASE_URL,
-        pool_size=3,
-        max_overflow=0,
-        pool_timeout=30,
-        pool_recycle=1800,
+        poolclass=pool_telemetry.pool_class_for("primary"),
         pool_pre_ping=True,
-        connect_args=connect_args
+        connect_args=connect_args,
+        **POOL_PROFILE
     )
 else:
     print("DATABASE: Using SQLite (NON-PERSISTENT - DATA WILL BE LOST)")
     DATABASE_URL = "sqlite:///./sql_app.db"
+    # Pool profiles apply to PostgreSQL only
+    POOL_PROFILE_NAME, POOL_PROFILE = "sqlite", {}
     engine = create_engine(
-        DATABASE_URL, connect_args={"check_same_thread": False}
+        DATABASE_URL,
+        poolclass=pool_telemetry.pool_class_for("primary"),
+        connect_args={"check_same_thread": False}
     )
 
+pool_telemetry.telemetry_for("primary").attach(engine)
+
+# Tuned SQLite profile (set SQLITE_TUNED=0 for the driver defaults).
+# WAL lets readers run while a write is in progress; synchronous=NORMAL is
+# durable in WAL mode except for the last commits on power loss; busy_timeout
+# makes a second writer wait instead of failing with "database is locked".
+SQLITE_TUNED = os.getenv("SQLITE_TUNED", "1") == "1"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "16384")),
+    "temp_store": "MEMORY",
+}
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+if engine.dialect.name == "sqlite" and SQLITE_TUNED:
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+
+# Optional read replica for read-only admin/analytics queries (see db_router.py).
+# A PostgreSQL standby gets the primary's pool profile; a second SQLite file
+# (e.g. a copy of sql_app.db) works as a local stand-in.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+replica_engine = None
+
+if DATABASE_REPLICA_URL:
+    if DATABASE_REPLICA_URL.startswith("postgres://"):
+        DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace("postgres://", "postgresql://", 1)
+
+    if DATABASE_REPLICA_URL.startswith("sqlite"):
+        print("DATABASE: Read replica on SQLite")
+        replica_engine = create_engine(
+            DATABASE_REPLICA_URL,
+            poolclass=pool_telemetry.pool_class_for("replica"),
+            connect_args={"check_same_thread": False}
+        )
+
+        @event.listens_for(replica_engine, "connect")
+        def _sqlite_replica_read_only(dbapi_connection, connection_record):
+            if SQLITE_TUNED:
+                _apply_sqlite_pragmas(dbapi_connection, connection_record)
+            dbapi_connection.execute("PRAGMA query_only=1")
+    else:
+        replica_url = make_url(DATABASE_REPLICA_URL).difference_update_query(["prepare_threshold"])
+        replica_connect_args = {
+            "sslmode": "disable" if "heroweb" in DATABASE_REPLICA_URL.lower() else "require",
+            "connect_timeout": 30
+        }
+        if TRANSACTION_POOLING and replica_url.get_dialect().driver == "psycopg":
+            replica_connect_args["prepare_threshold"] = None
+        print(f"DATABASE: Read replica on PostgreSQL (pool profile '{POOL_PROFILE_NAME}')")
+        replica_engine = create_engine(
+            replica_url,
+            poolclass=pool_telemetry.pool_class_for("replica"),
+            pool_pre_ping=True,
+            connect_args=replica_connect_args,
+            **POOL_PROFILE
+        )
+    pool_telemetry.telemetry_for("replica").attach(replica_engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else None
 Base = declarative_base()
 
-def get_db():
+@tracing.traced_dependency
+def get_db(request: Request = None):
     db = SessionLocal()
+    if request is not None:
+        # Lets the replica router pin this caller to the primary after a write
+        db.info["authorization"] = request.headers.get("authorization")
     try:
+        if not pool_telemetry.WAIT_HOOK:
+            pool_telemetry.timed_checkout(db, "primary")
         yield db
     finally:
         db.close()
+
+def prewarm_pool(count: int = None) -> int:
+    """
+    Open pooled connections before the first requests arrive, so cold starts
+    don't pay the connect/TLS handshake on the request path.
+    """
+    if engine.dialect.name == "sqlite":
+        return 0
+    from concurrent.futures import ThreadPoolExecutor
+    count = count or engine.pool.size()
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        connections = list(executor.map(lambda _: engine.connect(), range(count)))
+    for connection in connections:
+        connection.close()
+    return len(connections)
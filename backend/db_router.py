@@ -0,0 +1,175 @@
+"""
+Replica Router Module
+Sends read-only admin/analytics sessions to the read replica, with lag and read-your-writes checks
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from fastapi import Request
+from sqlalchemy import event, text
+import database, auth
+from cache import make_cache
+
+logger = logging.getLogger(__name__)
+
+# Replicas further behind than this are skipped
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "2"))
+# After a write, the same caller reads from the primary for at least this long
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+
+# Standby lag: 0 when everything received has been replayed (an idle primary
+# would otherwise look like growing lag), NULL -> 0 when not a standby
+PG_LAG_QUERY = text(
+    "SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)"
+)
+
+
+def principal(authorization: str):
+    """Stable caller key from an Authorization header (token subject), or None"""
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    email = auth.get_user_from_token(authorization[7:])
+    return hashlib.sha256(email.encode("utf-8")).hexdigest() if email else None
+
+
+class ReplicaRouter:
+    """
+    Picks the engine for a read-only session:
+    - primary when no replica is configured, it is unreachable, or it lags
+      more than REPLICA_MAX_LAG_SECONDS (lag is measured at most every
+      REPLICA_LAG_CHECK_SECONDS);
+    - primary for a caller that committed a write recently (read-your-writes),
+      for max(REPLICA_STICKY_SECONDS, current lag);
+    - the replica otherwise.
+    """
+
+    def __init__(self, replica_engine=None):
+        self.replica_engine = replica_engine
+        # Shared when CACHE_BACKEND=sqlite: a write pins its caller on every worker
+        self._recent_writes = make_cache(ttl=REPLICA_STICKY_SECONDS, max_entries=10000, name="replica_sticky")
+        self._lag = None
+        self._lag_checked_at = 0.0
+        self._lag_lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self.counts = {"replica": 0, "primary_sticky": 0, "primary_lag": 0, "primary_unavailable": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.replica_engine is not None
+
+    def measure_lag(self):
+        """Replication lag in seconds, or None if the replica cannot be reached"""
+        try:
+            with self.replica_engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    return float(conn.execute(PG_LAG_QUERY).scalar() or 0)
+                # SQLite stand-in: a copy has no replication stream to lag behind
+                conn.execute(text("SELECT 1"))
+                return 0.0
+        except Exception as e:
+            logger.warning("⚠️ Read replica unavailable: %s", e)
+            return None
+
+    def lag(self):
+        """Cached replication lag (None = unavailable)"""
+        now = time.monotonic()
+        if now - self._lag_checked_at < REPLICA_LAG_CHECK_SECONDS:
+            return self._lag
+        with self._lag_lock:
+            if now - self._lag_checked_at >= REPLICA_LAG_CHECK_SECONDS:
+                self._lag = self.measure_lag()
+                self._lag_checked_at = time.monotonic()
+        return self._lag
+
+    def note_write(self, caller: str):
+        """Pin `caller` to the primary until the replica has caught up with its write"""
+        lag = self._lag or 0.0
+        self._recent_writes.set(caller, True, ttl=max(REPLICA_STICKY_SECONDS, lag))
+
+    def choose(self, caller: str = None) -> str:
+        if not self.enabled:
+            return "primary"
+        if caller and self._recent_writes.get(caller):
+            route = "primary_sticky"
+        else:
+            lag = self.lag()
+            if lag is None:
+                route = "primary_unavailable"
+            elif lag > REPLICA_MAX_LAG_SECONDS:
+                route = "primary_lag"
+            else:
+                route = "replica"
+        with self._counts_lock:
+            self.counts[route] += 1
+        return "replica" if route == "replica" else "primary"
+
+    def session_factory(self, caller: str = None):
+        """sessionmaker for a read-only unit of work by `caller`"""
+        if self.choose(caller) == "replica":
+            return database.ReadSessionLocal
+        return database.SessionLocal
+
+    def stats(self) -> dict:
+        with self._counts_lock:
+            counts = dict(self.counts)
+        return {
+            "enabled": self.enabled,
+            "lag_seconds": self._lag,
+            "max_lag_seconds": REPLICA_MAX_LAG_SECONDS,
+            "sticky_seconds": REPLICA_STICKY_SECONDS,
+            "routes": counts,
+        }
+
+
+# Global router instance
+replica_router = ReplicaRouter(database.replica_engine)
+
+
+@event.listens_for(database.SessionLocal, "after_flush")
+def _flag_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(database.SessionLocal, "do_orm_execute")
+def _flag_bulk_write(orm_execute_state):
+    # Bulk UPDATE / DELETE / INSERT statements bypass the flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(database.SessionLocal, "after_commit")
+def _record_write(session):
+    if session.info.pop("wrote", False) and replica_router.enabled:
+        caller = principal(session.info.get("authorization"))
+        if caller:
+            replica_router.note_write(caller)
+
+
+@event.listens_for(database.SessionLocal, "after_rollback")
+def _clear_write(session):
+    session.info.pop("wrote", None)
+
+
+if database.ReadSessionLocal is not None:
+    @event.listens_for(database.ReadSessionLocal, "before_flush")
+    def _reject_replica_writes(session, flush_context, instances):
+        if session.new or session.dirty or session.deleted:
+            raise RuntimeError("Read-only session: writes must go through the primary")
+
+    @event.listens_for(database.ReadSessionLocal, "do_orm_execute")
+    def _reject_replica_bulk_writes(orm_execute_state):
+        if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+            raise RuntimeError("Read-only session: writes must go through the primary")
+
+
+def get_read_db(request: Request):
+    """Dependency for read-only admin/analytics endpoints (replica when safe)"""
+    db = replica_router.session_factory(principal(request.headers.get("authorization")))()
+    try:
+        yield db
+    finally:
+        db.close()
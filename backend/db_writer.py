@@ -0,0 +1,160 @@
+"""
+Database Writer Module
+Single serialized writer for SQLite: write jobs are queued to one thread, readers stay concurrent
+"""
+import os
+import queue
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WRITER_QUEUE_SIZE = int(os.getenv("DB_WRITER_QUEUE_SIZE", "10000"))
+
+_STOP = object()
+
+
+class SerializedWriter:
+    """
+    SQLite allows one writer at a time. Instead of letting request threads race
+    for the write lock (and time out with "database is locked"), write jobs are
+    queued and executed in order by a single thread with its own session.
+    A job is `fn(session)`; it is committed on success and rolled back on error,
+    and its return value (or exception) is delivered through a Future. Objects
+    it returns are not expired by the commit, so they stay readable.
+    On other databases jobs run immediately on the caller's thread; jobs
+    submitted on behalf of a request run on the request's own session, so a
+    request never holds two pool connections.
+
+    Every runtime write goes through it: visits, heartbeats, registrations,
+    user updates / deletes, bulk imports, visit counter flushes and outbox
+    state updates. Exempt: migrations (they run at startup, before the writer
+    and any request) and the offline maintenance scripts.
+    """
+
+    def __init__(self, engine=None, max_queue: int = WRITER_QUEUE_SIZE):
+        self.engine = engine or database.engine
+        self.enabled = self.engine.dialect.name == "sqlite"
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _execute(self, fn, args, kwargs, future: Future, connection=None):
+        if not future.set_running_or_notify_cancel():
+            return
+        if connection is not None:
+            db = database.SessionLocal(bind=connection, expire_on_commit=False)
+        else:
+            db = database.SessionLocal(expire_on_commit=False)
+        try:
+            self._commit(db, fn, args, kwargs, future)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _commit(db, fn, args, kwargs, future: Future):
+        try:
+            result = fn(db, *args, **kwargs)
+            db.commit()
+            future.set_result(result)
+        except BaseException as e:
+            db.rollback()
+            future.set_exception(e)
+
+    @property
+    def running(self) -> bool:
+        """True when jobs are queued to the writer thread (SQLite, started)"""
+        return self.enabled and self._thread is not None and self._thread.is_alive()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queue `fn(session, *args, **kwargs)`; returns a Future with its result"""
+        future = Future()
+        if not self.running:
+            # Not SQLite (or writer not started, e.g. scripts): write on this thread
+            self._execute(fn, args, kwargs, future)
+            return future
+        # The caller's context travels with the job (request-scoped instrumentation)
+        self._queue.put((contextvars.copy_context(), fn, args, kwargs, future))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Queue a job and wait for its result"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def submit_as(self, session, fn, *args, **kwargs) -> Future:
+        """
+        submit() on behalf of a request's session. Queued jobs get a copy of
+        its info (who is writing, used by the replica router to pin the caller
+        to the primary); when the writer is not running the job runs and
+        commits on `session` itself, on this thread.
+        """
+        if not self.running:
+            future = Future()
+            future.set_running_or_notify_cancel()
+            self._commit(session, fn, args, kwargs, future)
+            return future
+        info = dict(session.info)
+
+        def job(db):
+            db.info.update(info)
+            return fn(db, *args, **kwargs)
+
+        return self.submit(job)
+
+    def run_as(self, session, fn, *args, **kwargs):
+        """submit_as() and wait for the result"""
+        return self.submit_as(session, fn, *args, **kwargs).result()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        # One connection for the writer's lifetime: request threads waiting on
+        # a job hold pool connections, so the writer must never wait for the pool
+        with self.engine.connect() as connection:
+            while True:
+                job = self._queue.get()
+                if job is _STOP:
+                    return
+                context, fn, args, kwargs, future = job
+                context.run(self._execute, fn, args, kwargs, future, connection)
+
+    def start(self):
+        """Start the writer thread (SQLite only)"""
+        with self._lock:
+            if not self.enabled or (self._thread and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+            logger.info("✍️ SQLite serialized writer started")
+
+    def stop(self):
+        """Finish the queued jobs, then stop the thread"""
+        with self._lock:
+            if not self._thread:
+                return
+            self._queue.put(_STOP)
+            self._thread.join(timeout=30)
+            self._thread = None
+        # Jobs submitted while stopping run on this thread
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if job is not _STOP:
+                context, fn, args, kwargs, future = job
+                context.run(self._execute, fn, args, kwargs, future)
+
+
+# Global writer instance
+db_writer = SerializedWriter()
+
+metrics.registry.add_collector(lambda: [(
+    "db_writer_queue_depth", "gauge", "Write jobs waiting for the serialized SQLite writer",
+    [("", {}, db_writer.pending())],
+)])
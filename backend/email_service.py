@@ -2,57 +2,35 @@
 Email Service Module
 Handles email sending for verification and notifications
 """
+import re
 import secrets
 import smtplib
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.header import Header
+from email.utils import formataddr
+from email import quoprimime
 import os
 import logging
 from dotenv import load_dotenv
+import metrics
+import tracing
+import structured_logging
 
 # Load environment variables early
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
+structured_logging.configure()
 logger = logging.getLogger(__name__)
 
 
-class EmailService:
-    """Email service for sending verification and notification emails"""
-    
-    def __init__(self):
-        # Reiniciar variables de entorno para asegurar que tenemos las últimas después de load_dotenv
-        self.sender_email = os.getenv("SMTP_EMAIL", "electromatics.info@gmail.com")
-        self.sender_password = os.getenv("SMTP_PASSWORD")
-        self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        self.sender_name = "ElectrIA (Electromatics)"
-        
-        # If no password is provided, we stay in simulation mode
-        self.development_mode = not bool(self.sender_password)
-        
-        if self.development_mode:
-            logger.warning("⚠️ MODO SIMULACIÓN: SMTP_PASSWORD no configurado. Los correos se loguearán en consola.")
-        else:
-            logger.info(f"✅ SMTP configurado para: {self.sender_email}")
-        
-    def generate_verification_token(self) -> str:
-        """Generate a secure random verification token"""
-        return secrets.token_urlsafe(32)
-    
-    def get_token_expiry(self) -> datetime:
-        """Get expiry time for verification token (24 hours from now)"""
-        return datetime.utcnow() + timedelta(hours=24)
-
-    def get_electria_template(self, title: str, content: str, user_name: Optional[str] = None) -> str:
-        """
-        Returns a premium HTML template with ElectrIA branding
-        """
-        greeting = f"Hola, {user_name}" if user_name else "Estimado usuario"
-        
-        return f"""
+# ElectrIA HTML layout. Static parts are split once at import; only the slots change.
+ELECTRIA_TEMPLATE = """
         <html>
             <body style="font-family: 'Inter', Arial, sans-serif; background-color: #0b1116; color: #ffffff; padding: 40px; margin: 0;">
                 <div style="max-width: 600px; margin: 0 auto; background: #161f29; border: 1px solid #00e5ff; border-radius: 20px; overflow: hidden; box-shadow: 0 10px 30px rgba(0,0,0,0.5);">
@@ -94,39 +72,249 @@ class EmailService:
         </html>
         """
 
-    def send_email(self, recipient: str, subject: str, html_content: str) -> bool:
-        """Core method to send real email using SMTP"""
+_TEMPLATE_PARTS = tuple(re.split(r"\{title\}|\{greeting\}|\{content\}", ELECTRIA_TEMPLATE))
+
+# Placeholder rendered into compiled emails where each recipient's greeting goes
+_GREETING_SLOT = "\x00greeting\x00"
+
+
+def greeting_for(user_name: Optional[str]) -> str:
+    return f"Hola, {user_name}" if user_name else "Estimado usuario"
+
+
+def render_layout(title: str, greeting: str, content: str) -> str:
+    head, after_title, after_greeting, tail = _TEMPLATE_PARTS
+    return "".join((head, title, after_title, greeting, after_greeting, content, tail))
+
+
+def _qp(text: str) -> bytes:
+    """Quoted-printable encode UTF-8 text with CRLF line endings"""
+    return quoprimime.body_encode(text.encode("utf-8").decode("latin-1"), eol="\r\n").encode("ascii")
+
+
+class CompiledEmail:
+    """
+    A message rendered and MIME-encoded once, reused for many recipients.
+    Quoted-printable encodes line by line, so the greeting line is encoded
+    on its own and spliced between the pre-encoded head and tail of the body.
+    """
+
+    def __init__(self, service: "EmailService", subject: str, html_content: str):
+        self.subject = subject
+        self.html_content = html_content
+        self.sender = service.sender_email
+
+        before, after = html_content.split(_GREETING_SLOT, 1)
+        head, self._line_start = before.rsplit("\n", 1)
+        self._line_end, tail = after.split("\n", 1)
+
+        self._headers = (
+            f"From: {formataddr((service.sender_name, service.sender_email))}\r\n"
+        ).encode("utf-8")
+        encoded_subject = Header(subject, "utf-8").encode(linesep="\r\n")
+        self._mime_headers = (
+            f"Subject: {encoded_subject}\r\n"
+            "MIME-Version: 1.0\r\n"
+            'Content-Type: text/html; charset="utf-8"\r\n'
+            "Content-Transfer-Encoding: quoted-printable\r\n"
+            "\r\n"
+        ).encode("ascii")
+        self._body_head = _qp(head + "\n")
+        self._body_tail = _qp(tail)
+
+    def render(self, user_name: Optional[str] = None) -> str:
+        """Full HTML for one recipient"""
+        return self.html_content.replace(_GREETING_SLOT, greeting_for(user_name))
+
+    def as_bytes(self, recipient: str, user_name: Optional[str] = None) -> bytes:
+        """Complete RFC 5322 message for one recipient"""
+        greeting_line = _qp(self._line_start + greeting_for(user_name) + self._line_end + "\n")
+        return b"".join((
+            self._headers,
+            f"To: {recipient}\r\n".encode("utf-8"),
+            self._mime_headers,
+            self._body_head,
+            greeting_line,
+            self._body_tail,
+        ))
+
+
+class SMTPConnectionPool:
+    """
+    Keeps up to `size` authenticated SMTP sessions open and hands them out
+    to concurrent senders, so bulk sends skip the connect/TLS/login handshake.
+    """
+
+    def __init__(self, service: "EmailService", size: int = 3):
+        self.service = service
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a live session; it is returned to the pool unless it broke"""
+        self._slots.acquire()
+        server = None
+        try:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                server = self.service.connect()
+            yield server
+            self._idle.put(server)
+        except Exception:
+            self._discard(server)
+            raise
+        finally:
+            self._slots.release()
+
+    def send(self, msg) -> None:
+        """Send a Message through a pooled session"""
+        self._with_retry(lambda server: server.send_message(msg))
+
+    def sendmail(self, from_addr: str, to_addr: str, data: bytes) -> None:
+        """Send an already encoded message through a pooled session"""
+        self._with_retry(lambda server: server.sendmail(from_addr, [to_addr], data))
+
+    def _with_retry(self, action):
+        # Retry once on a stale connection
+        try:
+            with self.connection() as server:
+                action(server)
+        except smtplib.SMTPServerDisconnected:
+            with self.connection() as server:
+                action(server)
+
+    def _discard(self, server):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+class EmailService:
+    """Email service for sending verification and notification emails"""
+    
+    def __init__(self):
+        # Reiniciar variables de entorno para asegurar que tenemos las últimas después de load_dotenv
+        self.sender_email = os.getenv("SMTP_EMAIL", "electromatics.info@gmail.com")
+        self.sender_password = os.getenv("SMTP_PASSWORD")
+        self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+        self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
+        # STARTTLS can be disabled for local SMTP sinks (e.g. during load tests)
+        self.smtp_starttls = os.getenv("SMTP_STARTTLS", "true").lower() != "false"
+        self.sender_name = "ElectrIA (Electromatics)"
+        
+        # If no password is provided, we stay in simulation mode
+        self.development_mode = not bool(self.sender_password)
+        
+        if self.development_mode:
+            logger.warning("⚠️ MODO SIMULACIÓN: SMTP_PASSWORD no configurado. Los correos se loguearán en consola.")
+        else:
+            logger.info("✅ SMTP configurado para: %s", self.sender_email)
+        
+    def generate_verification_token(self) -> str:
+        """Generate a secure random verification token"""
+        return secrets.token_urlsafe(32)
+    
+    def get_token_expiry(self) -> datetime:
+        """Get expiry time for verification token (24 hours from now)"""
+        return datetime.utcnow() + timedelta(hours=24)
+
+    def get_electria_template(self, title: str, content: str, user_name: Optional[str] = None) -> str:
+        """
+        Returns a premium HTML template with ElectrIA branding
+        """
+        return render_layout(title, greeting_for(user_name), content)
+
+    def compile_email(self, subject: str, title: str, content: str) -> "CompiledEmail":
+        """Pre-render and pre-encode an email whose only per-recipient parts are To and greeting"""
+        return CompiledEmail(self, subject, render_layout(title, _GREETING_SLOT, content))
+
+    def compile_broadcast(self, subject: str, message: str) -> "CompiledEmail":
+        # Convert simple line breaks to <br> if needed
+        return self.compile_email(subject, subject, message.replace('\n', '<br>'))
+
+    def connect(self) -> smtplib.SMTP:
+        """Open an authenticated SMTP session"""
+        # Use SSL for port 465 or regular SMTP with TLS for other ports (like 587)
+        if self.smtp_port == 465:
+            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=30)
+        else:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+            if self.smtp_starttls:
+                server.starttls()
+        try:
+            server.ehlo_or_helo_if_needed()
+            if server.has_extn("auth"):
+                server.login(self.sender_email, self.sender_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def build_message(self, recipient: str, subject: str, html_content: str) -> MIMEMultipart:
+        msg = MIMEMultipart()
+        msg['From'] = f"{self.sender_name} <{self.sender_email}>"
+        msg['To'] = recipient
+        msg['Subject'] = subject
+        
+        msg.attach(MIMEText(html_content, 'html'))
+        return msg
+
+    def send_email(self, recipient: str, subject: str, html_content: str, pool: Optional[SMTPConnectionPool] = None) -> bool:
+        """Core method to send real email using SMTP (through `pool` when given)"""
         if self.development_mode:
-            logger.info(f"📧 [SIMULADO] Para: {recipient} | Asunto: {subject}")
+            logger.info("📧 [SIMULADO] Para: %s | Asunto: %s", recipient, subject)
             return True
 
         try:
-            msg = MIMEMultipart()
-            msg['From'] = f"{self.sender_name} <{self.sender_email}>"
-            msg['To'] = recipient
-            msg['Subject'] = subject
+            msg = self.build_message(recipient, subject, html_content)
             
-            msg.attach(MIMEText(html_content, 'html'))
-            
-            # Use SSL for port 465 or regular SMTP with TLS for other ports (like 587)
-            if self.smtp_port == 465:
-                logger.info(f"📧 Usando SMTP_SSL en puerto 465 para {recipient}")
-                with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as server:
-                    server.login(self.sender_email, self.sender_password)
-                    server.send_message(msg)
-            else:
-                logger.info(f"📧 Usando SMTP regular en puerto {self.smtp_port} para {recipient}")
-                with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                    server.starttls()
-                    server.login(self.sender_email, self.sender_password)
-                    server.send_message(msg)
+            with tracing.span("smtp.send", kind="client"), metrics.time_smtp():
+                if pool is not None:
+                    pool.send(msg)
+                else:
+                    logger.info("📧 Usando SMTP en puerto %s para %s", self.smtp_port, recipient)
+                    with self.connect() as server:
+                        server.send_message(msg)
             
             return True
         except Exception as e:
-            logger.error(f"❌ Error enviando email a {recipient}: {str(e)}")
+            logger.error("❌ Error enviando email a %s: %s", recipient, e)
             return False
 
-    def send_verification_email(self, email: str, token: str, user_name: Optional[str] = None) -> bool:
+    def send_compiled(self, compiled: CompiledEmail, recipient: str, user_name: Optional[str] = None, pool: Optional[SMTPConnectionPool] = None) -> bool:
+        """Send a CompiledEmail to one recipient, reusing its pre-encoded body"""
+        if self.development_mode:
+            logger.info("📧 [SIMULADO] Para: %s | Asunto: %s", recipient, compiled.subject)
+            return True
+
+        try:
+            data = compiled.as_bytes(recipient, user_name)
+            with tracing.span("smtp.send", kind="client"), metrics.time_smtp():
+                if pool is not None:
+                    pool.sendmail(compiled.sender, recipient, data)
+                else:
+                    with self.connect() as server:
+                        server.sendmail(compiled.sender, [recipient], data)
+            return True
+        except Exception as e:
+            logger.error("❌ Error enviando email a %s: %s", recipient, e)
+            return False
+
+    def render_verification_email(self, token: str, user_name: Optional[str] = None) -> tuple:
+        """Returns (subject, html_content) for the account verification email"""
         title = "Verificación de Cuenta"
         content = f"""
             ¡Bienvenido a la comunidad de Electromatics! Estoy aquí para asistirte en tus cálculos y validaciones eléctricas.
@@ -135,14 +323,17 @@ class EmailService:
             <br><br>
             <a href="http://localhost:8000/verify?token={token}" style="display: inline-block; background: #00e5ff; color: #000; padding: 12px 25px; border-radius: 10px; text-decoration: none; font-weight: bold;">Verificar mi Cuenta</a>
         """
-        html_content = self.get_electria_template(title, content, user_name)
-        return self.send_email(email, title, html_content)
+        return title, self.get_electria_template(title, content, user_name)
 
-    def send_broadcast_email(self, email: str, subject: str, message: str, user_name: Optional[str] = None) -> bool:
+    def send_verification_email(self, email: str, token: str, user_name: Optional[str] = None) -> bool:
+        subject, html_content = self.render_verification_email(token, user_name)
+        return self.send_email(email, subject, html_content)
+
+    def send_broadcast_email(self, email: str, subject: str, message: str, user_name: Optional[str] = None, pool: Optional[SMTPConnectionPool] = None) -> bool:
         # Convert simple line breaks to <br> if needed
         formatted_message = message.replace('\n', '<br>')
         html_content = self.get_electria_template(subject, formatted_message, user_name)
-        return self.send_email(email, subject, html_content)
+        return self.send_email(email, subject, html_content, pool=pool)
 
 
 # Global email service instance
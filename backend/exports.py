@@ -0,0 +1,109 @@
+"""
+Exports Module
+Incremental CSV / NDJSON writers for the admin user export
+"""
+import io
+import csv
+import json
+import zlib
+from datetime import timedelta
+import models, database
+
+# Rows fetched per server-side cursor round trip
+EXPORT_YIELD_PER = 1000
+
+# Rows written before a chunk is handed to the response
+EXPORT_CHUNK_ROWS = 500
+
+CSV_HEADER = ['ID', 'Email', 'Nombre Completo', 'Fecha Registro', 'Premium', 'Verificado', 'Admin']
+
+EXPORT_COLUMNS = (
+    models.User.id,
+    models.User.email,
+    models.User.full_name,
+    models.User.created_at,
+    models.User.is_premium,
+    models.User.email_verified,
+    models.User.is_admin,
+)
+
+
+def iter_user_rows(yield_per: int = EXPORT_YIELD_PER, session_factory=None):
+    """
+    Streams user rows (newest first) through a server-side cursor.
+    Uses its own session so the stream outlives the request's dependencies
+    (`session_factory` picks the engine, e.g. the read replica).
+    """
+    db = (session_factory or database.SessionLocal)()
+    try:
+        query = db.query(*EXPORT_COLUMNS).order_by(models.User.id.desc()).execution_options(yield_per=yield_per)
+        for row in query:
+            yield row
+    finally:
+        db.close()
+
+
+def csv_row(user) -> list:
+    return [
+        user.id,
+        user.email,
+        user.full_name,
+        (user.created_at - timedelta(hours=4)).strftime('%Y-%m-%d %H:%M') if user.created_at else '',
+        'Sí' if user.is_premium else 'No',
+        'Sí' if user.email_verified else 'No',
+        'Sí' if user.is_admin else 'No'
+    ]
+
+
+def ndjson_row(user) -> dict:
+    return {
+        "id": user.id,
+        "email": user.email,
+        "full_name": user.full_name,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+        "is_premium": bool(user.is_premium),
+        "email_verified": bool(user.email_verified),
+        "is_admin": bool(user.is_admin),
+    }
+
+
+def iter_csv(rows, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Yields CSV text in chunks of `chunk_rows` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+
+    pending = 0
+    for user in rows:
+        writer.writerow(csv_row(user))
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Yields NDJSON text (one user object per line) in chunks of `chunk_rows` rows"""
+    lines = []
+    for user in rows:
+        lines.append(json.dumps(ndjson_row(user), ensure_ascii=False))
+        if len(lines) >= chunk_rows:
+            yield "\n".join(lines) + "\n"
+            lines = []
+
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def iter_gzip(chunks, level: int = 6):
+    """Gzip-compresses a stream of text chunks incrementally"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
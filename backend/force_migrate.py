@@ -1,13 +1,14 @@
 
 import logging
 from database import engine
+import models
 from migrations import run_migrations
 
 logging.basicConfig(level=logging.INFO)
 
 print("Running migrations...")
 try:
-    run_migrations(engine)
+    run_migrations(engine, models.Base.metadata, force=True)
     print("Migrations finished.")
 except Exception as e:
     print(f"CRITICAL ERROR: {e}")
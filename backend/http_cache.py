@@ -0,0 +1,141 @@
+"""
+HTTP Cache Module
+Conditional GET (ETag / If-None-Match -> 304) and Cache-Control policies for read endpoints
+"""
+import os
+import time
+import hashlib
+import logging
+import auth
+from cache import payload_versions
+
+logger = logging.getLogger(__name__)
+
+# ETags also roll over every bucket, bounding staleness when a version bump
+# does not reach every worker (per-process versions, failed shared bumps)
+ETAG_MAX_AGE_SECONDS = int(os.getenv("ETAG_MAX_AGE_SECONDS", "60"))
+
+
+class CachePolicy:
+    """
+    `versions`: payload version names the response depends on.
+    `private`: response depends on the caller; the bearer token is part of the ETag
+    and must be valid for a 304 to be answered without the handler.
+    """
+
+    def __init__(self, cache_control: str, versions: tuple = (), private: bool = False):
+        self.cache_control = cache_control.encode("ascii")
+        self.versions = versions
+        self.private = private
+
+
+_policies = {}
+
+
+def register(path: str, cache_control: str, versions: tuple = (), private: bool = False):
+    """Attach a caching policy to an exact path (or a prefix ending in '*')"""
+    _policies[path] = CachePolicy(cache_control, versions, private)
+
+
+def policy_for(path: str):
+    policy = _policies.get(path)
+    if policy is not None:
+        return policy
+    for pattern, candidate in _policies.items():
+        if pattern.endswith("*") and path.startswith(pattern[:-1]):
+            return candidate
+    return None
+
+
+def _header(scope, name: bytes) -> bytes:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value
+    return b""
+
+
+def compute_etag(scope, policy: CachePolicy):
+    """Strong ETag for the current payload versions, or None if it cannot be validated"""
+    # Epoch of the version store: per process, or shared with CACHE_BACKEND=sqlite
+    epoch = payload_versions.epoch()
+    if epoch is None:
+        return None
+    parts = [epoch, scope["path"], scope.get("query_string", b"").decode("latin-1"),
+             _header(scope, b"accept-encoding").decode("latin-1"),
+             str(int(time.time() // ETAG_MAX_AGE_SECONDS))]
+
+    for name in policy.versions:
+        version = payload_versions.get(name)
+        if version is None:
+            return None
+        parts.append(f"{name}={version}")
+
+    if policy.private:
+        authorization = _header(scope, b"authorization").decode("latin-1")
+        if not authorization.startswith("Bearer ") or not auth.get_user_from_token(authorization[7:]):
+            return None
+        parts.append(authorization)
+
+    digest = hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}"'.encode("ascii")
+
+
+def etag_matches(if_none_match: bytes, etag: bytes) -> bool:
+    for candidate in if_none_match.split(b","):
+        candidate = candidate.strip()
+        if candidate.startswith(b"W/"):
+            candidate = candidate[2:]
+        if candidate == etag or candidate == b"*":
+            return True
+    return False
+
+
+class ConditionalCacheMiddleware:
+    """
+    For GET requests on registered paths: answers 304 Not Modified without
+    running the handler when If-None-Match matches the current ETag, and
+    adds ETag / Cache-Control headers to successful responses.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        policy = policy_for(scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        etag = compute_etag(scope, policy)
+        if etag is not None:
+            if_none_match = _header(scope, b"if-none-match")
+            if if_none_match and etag_matches(if_none_match, etag):
+                await send({
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": [(b"etag", etag), (b"cache-control", policy.cache_control)],
+                })
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        async def send_with_validators(message):
+            nonlocal etag
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                # First fill of a payload (e.g. BCV rate): its version exists only now
+                if etag is None:
+                    etag = compute_etag(scope, policy)
+                headers = [
+                    (name, value) for name, value in message.get("headers", [])
+                    if name.lower() not in (b"etag", b"cache-control")
+                ]
+                headers.append((b"cache-control", policy.cache_control))
+                if etag is not None:
+                    headers.append((b"etag", etag))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_validators)
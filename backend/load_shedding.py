@@ -0,0 +1,279 @@
+"""
+Load Shedding Module
+Per-route concurrency classes with bounded priority wait queues and deadline-aware rejection,
+so slow upstream calls or CPU-heavy logins cannot take all of a worker's capacity
+"""
+import os
+import math
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LOAD_SHEDDING_ENABLED = os.getenv("LOAD_SHEDDING_ENABLED", "1") == "1"
+# Optional client budget in seconds; requests that cannot start in time are rejected at once
+TIMEOUT_HEADER = b"x-request-timeout"
+# Background requests (analytics) may use at most this share of a class's slots
+BACKGROUND_SHARE = float(os.getenv("SHED_BACKGROUND_SHARE", "0.75"))
+# Weight of the newest request in the service time average
+SERVICE_TIME_ALPHA = 0.1
+SHED_LOG_INTERVAL = 10
+
+# Priorities within a class (lower is served first)
+INTERACTIVE = 0
+BACKGROUND = 1
+
+requests_shed = metrics.registry.counter(
+    "http_requests_shed", "Requests rejected by load shedding by class and reason", ("class", "reason"))
+queue_wait = metrics.registry.histogram(
+    "http_request_queue_wait_seconds", "Time admitted requests waited for a concurrency slot", ("class",))
+
+
+class ConcurrencyClass:
+    """
+    At most `limit` requests of this class run at once; up to `queue_size`
+    wait (interactive before background, FIFO within a priority) for at most
+    `max_wait` seconds. A request is rejected without waiting when the queue
+    is full (unless it can displace a lower-priority waiter) or when the
+    estimated wait already exceeds its budget.
+    Only touched from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self.queued = [0, 0]  # per priority
+        self.service_time = 0.0  # moving average, seconds
+        self._waiters = []  # heap of [priority, sequence, future]
+        self._sequence = itertools.count()
+        self._last_shed_log = 0.0
+
+    def slots(self, priority: int) -> int:
+        if priority == INTERACTIVE:
+            return self.limit
+        return max(1, int(self.limit * BACKGROUND_SHARE))
+
+    def estimated_wait(self, priority: int = BACKGROUND) -> float:
+        """
+        Seconds until a new waiter of `priority` would start, from the waiters
+        served before it (same or higher priority) and recent service times
+        """
+        return (sum(self.queued[:priority + 1]) // self.limit + 1) * self.service_time
+
+    def _displace(self, priority: int) -> bool:
+        """Frees a queue place by rejecting the newest waiter of lower priority"""
+        candidates = [w for w in self._waiters if w[0] > priority and not w[2].done()]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda w: (w[0], w[1]))
+        self.queued[victim[0]] -= 1
+        victim[2].set_result(False)
+        return True
+
+    async def acquire(self, priority: int, budget: float):
+        """None once a slot is held (call release()), else the rejection reason"""
+        ahead = sum(self.queued[:priority + 1])
+        if ahead == 0 and self.active < self.slots(priority):
+            self.active += 1
+            queue_wait.labels(self.name).observe(0)
+            return None
+
+        if sum(self.queued) >= self.queue_size and not self._displace(priority):
+            return "queue_full"
+        if self.estimated_wait(priority) > budget:
+            return "deadline"
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._sequence), future])
+        self.queued[priority] += 1
+        start = time.perf_counter()
+        try:
+            admitted = await asyncio.wait_for(future, budget)
+        except asyncio.TimeoutError:
+            if not future.done() or future.cancelled():
+                self.queued[priority] -= 1
+                return "timeout"
+            # Granted (or displaced) just as the timeout fired: release() or
+            # _displace() already took it off the queue, keep the outcome
+            admitted = future.result()
+        except asyncio.CancelledError:
+            # Client went away: give back a slot that was granted meanwhile
+            if future.done() and not future.cancelled() and future.result():
+                self.release(0.0)
+            elif future.cancelled():
+                self.queued[priority] -= 1
+            raise
+        if not admitted:
+            return "displaced"
+        queue_wait.labels(self.name).observe(time.perf_counter() - start)
+        return None
+
+    def release(self, service_seconds: float):
+        self.active -= 1
+        if service_seconds:
+            self.service_time += SERVICE_TIME_ALPHA * (service_seconds - self.service_time)
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.active >= self.slots(priority):
+                break
+            heapq.heappop(self._waiters)
+            self.queued[priority] -= 1
+            self.active += 1
+            future.set_result(True)
+
+    def note_shed(self, reason: str):
+        requests_shed.labels(self.name, reason).inc()
+        now = time.monotonic()
+        if now - self._last_shed_log >= SHED_LOG_INTERVAL:
+            self._last_shed_log = now
+            logger.warning(
+                "🚦 Shedding '%s' requests (%s): %s active, %s queued, ~%.2fs service time",
+                self.name, reason, self.active, sum(self.queued), self.service_time,
+            )
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "max_wait": self.max_wait,
+            "active": self.active,
+            "queued_interactive": self.queued[INTERACTIVE],
+            "queued_background": self.queued[BACKGROUND],
+            "service_time_ms": round(self.service_time * 1000, 2),
+        }
+
+
+def _class_from_env(name: str, limit: int, queue_size: int, max_wait: float) -> ConcurrencyClass:
+    """SHED_<NAME>_LIMIT / _QUEUE / _MAX_WAIT override the defaults"""
+    prefix = f"SHED_{name.upper()}_"
+    return ConcurrencyClass(
+        name,
+        int(os.getenv(prefix + "LIMIT", str(limit))),
+        int(os.getenv(prefix + "QUEUE", str(queue_size))),
+        float(os.getenv(prefix + "MAX_WAIT", str(max_wait))),
+    )
+
+
+CLASSES = {
+    # Short DB reads and writes (heartbeats, /users/me, health checks)
+    "cheap": _class_from_env("cheap", 64, 256, 2.0),
+    # Password hashing: more runners than cores only adds latency
+    "cpu": _class_from_env("cpu", max(2, (os.cpu_count() or 1) * 2), 64, 5.0),
+    # Gemini calls hold a thread for up to their timeout; capped well
+    # below the threadpool size so they never take every thread
+    "ai": _class_from_env("ai", 16, 32, 5.0),
+    # BCV rate: usually a cache hit, a slow scrape on a miss (kept apart from AI)
+    "bcv": _class_from_env("bcv", 8, 64, 5.0),
+    # Dashboards, exports, bulk operations
+    "admin": _class_from_env("admin", 4, 16, 10.0),
+}
+DEFAULT_RULE = ("cheap", INTERACTIVE)
+
+_rules = {}
+
+
+def register(path: str, class_name: str, priority: int = INTERACTIVE):
+    """Route an exact path (or a prefix ending in '*') to a concurrency class"""
+    if class_name not in CLASSES:
+        raise ValueError(f"Unknown concurrency class: {class_name}")
+    _rules[path] = (class_name, priority)
+
+
+def rule_for(path: str) -> tuple:
+    rule = _rules.get(path)
+    if rule is not None:
+        return rule
+    for pattern, candidate in _rules.items():
+        if pattern.endswith("*") and path.startswith(pattern[:-1]):
+            return candidate
+    return DEFAULT_RULE
+
+
+def snapshot_all() -> list:
+    return [concurrency_class.snapshot() for concurrency_class in CLASSES.values()]
+
+
+def collect_metrics():
+    """Prometheus families for the concurrency classes (see metrics.Registry)"""
+    classes = snapshot_all()
+    yield "http_concurrency_limit", "gauge", "Concurrent requests allowed per class", [
+        ("", {"class": c["name"]}, c["limit"]) for c in classes
+    ]
+    yield "http_concurrency_active", "gauge", "Requests running per class", [
+        ("", {"class": c["name"]}, c["active"]) for c in classes
+    ]
+    yield "http_concurrency_queued", "gauge", "Requests waiting for a slot per class and priority", [
+        ("", {"class": c["name"], "priority": priority}, c[f"queued_{priority}"])
+        for c in classes for priority in ("interactive", "background")
+    ]
+
+
+metrics.registry.add_collector(collect_metrics)
+
+
+def _client_timeout(scope):
+    for key, value in scope.get("headers", []):
+        if key == TIMEOUT_HEADER:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+class LoadSheddingMiddleware:
+    """
+    Admits each HTTP request through its route's concurrency class. Rejected
+    requests get 503 with Retry-After. The wait budget is the class max_wait,
+    shortened by the client's X-Request-Timeout minus the typical service time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def _reject(self, send, concurrency_class: ConcurrencyClass, priority: int):
+        retry_after = max(1, math.ceil(concurrency_class.estimated_wait(priority)))
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"retry-after", str(retry_after).encode("ascii")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b'{"detail":"Server busy, please retry shortly"}'})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not LOAD_SHEDDING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        class_name, priority = rule_for(scope["path"])
+        concurrency_class = CLASSES[class_name]
+        budget = concurrency_class.max_wait
+        client_timeout = _client_timeout(scope)
+        if client_timeout is not None:
+            budget = min(budget, client_timeout - concurrency_class.service_time)
+
+        reason = await concurrency_class.acquire(priority, max(budget, 0.0))
+        if reason is not None:
+            concurrency_class.note_shed(reason)
+            await self._reject(send, concurrency_class, priority)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            concurrency_class.release(time.perf_counter() - start)
@@ -1,97 +1,172 @@
 import os
+import asyncio
 import logging
+from startup_profile import startup_profile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file FIRST
 load_dotenv()
 
 from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text
+from sqlalchemy import func, text, distinct
 from datetime import datetime, timedelta
+from typing import Optional
 import models, schemas, auth, database
 from email_service import email_service
-import requests
-import pydantic
+from counters import visit_counter
+from db_writer import db_writer
+import user_search
+import exports
+import bulk_import
+from broadcast_jobs import broadcast_jobs, recipients_query
+import outbox
+from outbox import outbox_worker
+from middleware import CORSMiddleware, CompressionMiddleware
+from responses import FastJSONResponse, model_response, raw_json_response
+import http_cache
+from http_cache import ConditionalCacheMiddleware
+from cache import make_cache, payload_versions
 import migrations
-import json
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+import pool_telemetry
+import db_router
+import metrics
+import query_stats
+import profiling
+import tracing
+import structured_logging
+import load_shedding
+from bcv import parse_bcv_html
+
+# Configure logging (queued JSON records, see structured_logging.py)
+structured_logging.configure()
 logger = logging.getLogger(__name__)
+# One record per page visit / heartbeat: sampled via LOG_SAMPLING
+visit_logger = logging.getLogger(f"{__name__}.visits")
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+# Every endpoint can be sampled by the on-demand profiler (see profiling.py)
+app.router.route_class = profiling.ProfiledRoute
+startup_profile.checkpoint("imports")
 
 @app.on_event("startup")
 async def startup_event():
-    # Run migrations and create tables safely in background
+    # Versioned migrations: a single fingerprint query when the schema is current
     try:
-        logger.info("🚀 Starting database initialization in background...")
+        logger.info("🚀 Starting database initialization...")
         # Obfuscated URL for logging
         db_url_clean = str(database.engine.url).split("@")[-1] if "@" in str(database.engine.url) else "local"
-        logger.info(f"📡 Target DB Host: {db_url_clean}")
+        logger.info("📡 Target DB Host: %s", db_url_clean)
         
-        migrations.run_migrations(database.engine)
-        models.Base.metadata.create_all(bind=database.engine)
+        with startup_profile.step("migrations"):
+            migrations.run_migrations(database.engine, models.Base.metadata)
+        with startup_profile.step("pool_prewarm"):
+            database.prewarm_pool()
         logger.info("✅ Database initialization successful.")
     except Exception as e:
-        logger.error(f"❌ DATABASE INIT FAILED: {str(e)}")
+        logger.error("❌ DATABASE INIT FAILED: %s", e)
         logger.error("The app is running but DB calls might fail.")
 
+    # Initial payload versions for conditional GETs
+    for name in ("users", "visits", "config"):
+        payload_versions.bump(name)
+
+    with startup_profile.step("background_workers"):
+        tracing.exporter.start()
+        db_writer.start()
+        visit_counter.start()
+        outbox_worker.start()
+    startup_profile.log_report()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Persist buffered visit counts before the process exits
+    visit_counter.stop()
+    bulk_import.shutdown_executor()
+    broadcast_jobs.shutdown()
+    outbox_worker.stop()
+    db_writer.stop()
+    tracing.exporter.stop()
+
 
 # CORS Configuration - Allow frontend origins
-# Manual CORS Middleware - Brute Force
-@app.middleware("http")
-async def cors_middleware(request: Request, call_next):
-    # Handle preflight OPTIONS requests directly
-    if request.method == "OPTIONS":
-        return Response(
-            status_code=204,
-            headers={
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "*",
-                "Access-Control-Allow-Headers": "*",
-            }
-        )
-    
-    # Handle normal requests
-    try:
-        response = await call_next(request)
-        # Force CORS headers on response
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Methods"] = "*"
-        response.headers["Access-Control-Allow-Headers"] = "*"
-        return response
-    except Exception as e:
-        # Fallback for errors to ensure they also get CORS headers
-        return JSONResponse(
-            status_code=500,
-            content={"detail": str(e)},
-            headers={
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "*",
-                "Access-Control-Allow-Headers": "*"
-            }
-        )
+# Pure ASGI stack: CORS wraps caching/compression so preflights never reach the app
+app.add_middleware(tracing.traced_middleware(ConditionalCacheMiddleware))
+app.add_middleware(tracing.traced_middleware(CompressionMiddleware))
+# Concurrency classes: inside CORS so 503s still carry CORS headers
+app.add_middleware(tracing.traced_middleware(load_shedding.LoadSheddingMiddleware))
+app.add_middleware(tracing.traced_middleware(CORSMiddleware))
+# SQL query counts / slow-query log / N+1 detection per request
+query_stats.instrument(database.engine)
+query_stats.instrument(database.replica_engine)
+app.add_middleware(tracing.traced_middleware(query_stats.QueryStatsMiddleware))
+# Admin "X-Profile" header / PROFILE_SAMPLE_RATE -> sampled profile files
+app.add_middleware(tracing.traced_middleware(profiling.ProfilingMiddleware))
+# Request latency includes the whole middleware stack
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+# Request id for log records (inside tracing, so it can reuse the trace id)
+app.add_middleware(structured_logging.RequestIdMiddleware)
+# Outermost: root span per request, traceparent / X-Trace-Id response headers
+if tracing.TRACING_ENABLED:
+    tracing.instrument(database.engine)
+    tracing.instrument(database.replica_engine)
+    app.add_middleware(tracing.TracingMiddleware)
+
+# Concurrency classes per route (unlisted routes are "cheap" / interactive)
+load_shedding.register("/analytics/*", "cheap", load_shedding.BACKGROUND)
+load_shedding.register("/token", "cpu")
+load_shedding.register("/register", "cpu")
+load_shedding.register("/verify-email", "cpu")
+load_shedding.register("/resend-verification", "cpu")
+load_shedding.register("/generate-content", "ai")
+load_shedding.register("/api/bcv", "bcv")
+load_shedding.register("/admin/*", "admin")
+# Diagnostics must stay reachable while exports fill the admin class
+load_shedding.register("/admin/load", "cheap")
+
+# HTTP caching policies for read endpoints (ETag + Cache-Control)
+http_cache.register("/api/bcv", "public, max-age=300", versions=("bcv",))
+http_cache.register("/admin/stats", "private, no-cache", versions=("users", "visits"), private=True)
+http_cache.register("/users/me", "private, no-cache", versions=("users",), private=True)
+http_cache.register("/health/*", "public, max-age=60", versions=("config",))
 
 @app.post("/register", response_model=schemas.User)
 def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    logger.info(f"Attempting to register user: {user.email}")
+    logger.info("Attempting to register user: %s", user.email)
     db_user = db.query(models.User).filter(models.User.email == user.email).first()
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    # Check if this is the first user to make them admin
-    is_first_user = db.query(models.User).count() == 0
-    
     # Generate verification token
     verification_token = email_service.generate_verification_token()
     token_expiry = email_service.get_token_expiry()
+    subject, html_content = email_service.render_verification_email(verification_token, user.full_name)
     
     hashed_password = auth.get_password_hash(user.password)
+    new_user = db_writer.run_as(
+        db, create_user, user, hashed_password, verification_token, token_expiry, subject, html_content
+    )
+    if new_user is None:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    user_search.invalidate_user_caches()
+    outbox_worker.notify()
+    
+    return new_user
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str, verification_token: str,
+                token_expiry: datetime, subject: str, html_content: str) -> Optional[models.User]:
+    # Checked again here: the writer serializes registrations, so the
+    # email check and the first-user check cannot race with another one
+    if db.query(models.User.id).filter(models.User.email == user.email).first():
+        return None
+    
+    # Check if this is the first user to make them admin
+    is_first_user = db.query(models.User).count() == 0
+    
     new_user = models.User(
         email=user.email,
         hashed_password=hashed_password,
@@ -103,16 +178,10 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_d
         verification_token_expires=token_expiry
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
-    # Send verification email (in dev mode, this logs to console)
-    email_service.send_verification_email(
-        email=new_user.email,
-        token=verification_token,
-        user_name=new_user.full_name
-    )
     
+    # Verification email goes through the outbox, committed together with the user
+    outbox.enqueue(db, user.email, subject, html_content)
+    db.flush()
     return new_user
 
 @app.post("/verify-email", response_model=schemas.VerificationResponse)
@@ -129,13 +198,17 @@ def verify_email(verification: schemas.EmailVerification, db: Session = Depends(
         raise HTTPException(status_code=400, detail="Verification token has expired")
     
     # Verify the email
-    user.email_verified = True
-    user.verification_token = None
-    user.verification_token_expires = None
-    db.commit()
+    db_writer.run_as(db, mark_email_verified, user.id)
     
     return {"success": True, "message": "Email verified successfully!"}
 
+def mark_email_verified(db: Session, user_id: int):
+    db.query(models.User).filter(models.User.id == user_id).update({
+        "email_verified": True,
+        "verification_token": None,
+        "verification_token_expires": None,
+    }, synchronize_session=False)
+
 @app.post("/resend-verification")
 def resend_verification(email: str, db: Session = Depends(database.get_db)):
     user = db.query(models.User).filter(models.User.email == email).first()
@@ -150,19 +223,22 @@ def resend_verification(email: str, db: Session = Depends(database.get_db)):
     verification_token = email_service.generate_verification_token()
     token_expiry = email_service.get_token_expiry()
     
-    user.verification_token = verification_token
-    user.verification_token_expires = token_expiry
-    db.commit()
-    
-    # Send verification email
-    email_service.send_verification_email(
-        email=user.email,
-        token=verification_token,
-        user_name=user.full_name
-    )
+    subject, html_content = email_service.render_verification_email(verification_token, user.full_name)
+    db_writer.run_as(db, store_verification_token, user.id, user.email, verification_token, token_expiry, subject, html_content)
+    outbox_worker.notify()
     
     return {"success": True, "message": "Verification email sent"}
 
+def store_verification_token(db: Session, user_id: int, email: str, verification_token: str,
+                             token_expiry: datetime, subject: str, html_content: str):
+    db.query(models.User).filter(models.User.id == user_id).update({
+        "verification_token": verification_token,
+        "verification_token_expires": token_expiry,
+    }, synchronize_session=False)
+    
+    # Queue verification email in the same transaction
+    outbox.enqueue(db, email, subject, html_content)
+
 @app.post("/token", response_model=schemas.Token)
 def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
     user = db.query(models.User).filter(models.User.email == form_data.username).first()
@@ -180,9 +256,8 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
             detail="Please verify your email before logging in",
         )
     
-    # Increment visit count
-    user.visit_count = (user.visit_count or 0) + 1
-    db.commit()
+    # Increment visit count (buffered, flushed in batches)
+    visit_counter.increment(user.id)
     
     access_token = auth.create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -192,7 +267,7 @@ def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
     return current_user
 
 @app.get("/admin/stats")
-def read_admin_stats(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
+def read_admin_stats(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(db_router.get_read_db)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
@@ -213,7 +288,11 @@ def read_admin_stats(current_user: models.User = Depends(auth.get_current_user),
     
     # Active sessions (heartbeat in last 5 mins)
     five_mins_ago = datetime.utcnow() - timedelta(minutes=5)
-    active_users = db.query(models.PageVisit.session_id).filter(models.PageVisit.last_heartbeat >= five_mins_ago).distinct().count()
+    # count(DISTINCT ...) is answered from ix_page_visits_heartbeat_session (a range scan);
+    # .distinct().count() wraps a subquery that SQLite serves with a full session_id index scan
+    active_users = db.query(func.count(distinct(models.PageVisit.session_id))).filter(
+        models.PageVisit.last_heartbeat >= five_mins_ago
+    ).scalar()
     
     # Top Pages
     top_pages = db.query(
@@ -226,13 +305,13 @@ def read_admin_stats(current_user: models.User = Depends(auth.get_current_user),
 
     # Log registration dates for debugging
     if recent_users:
-        logger.info(f"Sample user date: {recent_users[0].created_at}")
+        logger.info("Sample user date: %s", recent_users[0].created_at)
 
     return {
         "total_users": total_users,
         "premium_users": premium_users,
         "verified_users": verified_users,
-        "recent_users": recent_users,
+        "recent_users": [schemas.User.model_validate(u).model_dump(mode="json") for u in recent_users],
         "analytics": {
             "total_visits": total_visits,
             "total_duration_minutes": round(total_duration / 60, 1),
@@ -241,98 +320,159 @@ def read_admin_stats(current_user: models.User = Depends(auth.get_current_user),
         }
     }
 
+@app.get("/admin/db/pool")
+def read_pool_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Connection-pool telemetry: checkout wait, in-use connections, timeouts.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {
+        "profile": database.POOL_PROFILE_NAME,
+        "settings": database.POOL_PROFILE,
+        "pools": pool_telemetry.snapshot_all(),
+        "replica": db_router.replica_router.stats(),
+    }
+
+@app.get("/admin/load")
+def read_load_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Concurrency classes of this worker: limits, running and queued requests.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {"enabled": load_shedding.LOAD_SHEDDING_ENABLED, "classes": load_shedding.snapshot_all()}
+
+@app.get("/admin/profiles")
+def list_profiles(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Saved request profiles, newest first (request one with the X-Profile header).
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {"profiles": profiling.profile_store.list()}
+
+@app.get("/admin/profiles/{name}")
+def download_profile(name: str, current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Download a profile (open .speedscope.json files at speedscope.app,
+    .collapsed.txt with flamegraph.pl / inferno).
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    path = profiling.profile_store.path_for(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "application/json" if name.endswith(".json") else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=name)
+
 @app.get("/admin/users", response_model=schemas.UsersList)
 def get_all_users(
     skip: int = 0, 
     limit: int = 20, 
     search: str = None,
+    cursor: Optional[int] = None,
     current_user: models.User = Depends(auth.get_current_user), 
-    db: Session = Depends(database.get_db)
+    db: Session = Depends(db_router.get_read_db)
 ):
     """
     Get all users with pagination and optional search.
+    Pass `cursor` (the `next_cursor` of the previous page) for keyset pagination;
+    `skip` is kept for offset-based clients.
     Admin only endpoint.
     """
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Base query
-    query = db.query(models.User)
-    
-    # Apply search filter if provided
-    if search:
-        search_filter = f"%{search}%"
-        query = query.filter(
-            (models.User.email.ilike(search_filter)) | 
-            (models.User.full_name.ilike(search_filter))
-        )
+    users, next_cursor = user_search.page_users(db, limit=limit, cursor=cursor, skip=skip, search=search)
     
-    # Get total count for pagination
-    total = query.count()
+    # Cached total count for pagination
+    total = user_search.count_users(db, search)
     
-    # Apply pagination
-    users = query.order_by(models.User.id.desc()).offset(skip).limit(limit).all()
-    
-    return {
+    # Validate ORM rows once and serialize in pydantic-core
+    return model_response(schemas.UsersList.model_validate({
         "total": total,
         "skip": skip,
         "limit": limit,
+        "next_cursor": next_cursor,
         "users": users
-    }
+    }, from_attributes=True))
 
 @app.get("/admin/users/export")
 def export_users_csv(
-    current_user: models.User = Depends(auth.get_current_user), 
-    db: Session = Depends(database.get_db)
+    request: Request,
+    format: str = "csv",
+    gzip: bool = False,
+    current_user: models.User = Depends(auth.get_current_user)
 ):
     """
-    Export all users to CSV format.
+    Export all users as CSV (default) or NDJSON, optionally gzip-compressed.
+    Rows are streamed from a server-side cursor, so memory stays flat.
     Admin only endpoint.
     """
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Get all users
-    users = db.query(models.User).order_by(models.User.id.desc()).all()
-    
-    # Create CSV content
-    import io
-    import csv
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['ID', 'Email', 'Nombre Completo', 'Fecha Registro', 'Premium', 'Verificado', 'Admin'])
-    
-    # Write user data
-    for user in users:
-        writer.writerow([
-            user.id,
-            user.email,
-            user.full_name,
-            (user.created_at - timedelta(hours=4)).strftime('%Y-%m-%d %H:%M') if user.created_at else '',
-            'Sí' if user.is_premium else 'No',
-            'Sí' if user.email_verified else 'No',
-            'Sí' if user.is_admin else 'No'
-        ])
-    
-    # Get CSV content
-    csv_content = output.getvalue()
-    output.close()
-    
-    # Return as downloadable file
-    from fastapi.responses import Response
-    filename = f"usuarios_electromatics_{datetime.utcnow().strftime('%Y%m%d')}.csv"
-    
-    return Response(
-        content=csv_content,
-        media_type="text/csv",
+    # Read replica when it is safe for this caller
+    session_factory = db_router.replica_router.session_factory(
+        db_router.principal(request.headers.get("authorization"))
+    )
+    if format == "csv":
+        chunks = exports.iter_csv(exports.iter_user_rows(session_factory=session_factory))
+        media_type = "text/csv"
+    elif format == "ndjson":
+        chunks = exports.iter_ndjson(exports.iter_user_rows(session_factory=session_factory))
+        media_type = "application/x-ndjson"
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported format. Use 'csv' or 'ndjson'")
+    
+    filename = f"usuarios_electromatics_{datetime.utcnow().strftime('%Y%m%d')}.{format}"
+    if gzip:
+        chunks = exports.iter_gzip(chunks)
+        media_type = "application/gzip"
+        filename += ".gz"
+    
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
         headers={
             "Content-Disposition": f"attachment; filename={filename}"
         }
     )
 
+@app.post("/admin/users/import", response_model=schemas.BulkImportReport)
+async def import_users(
+    request: Request,
+    format: Optional[str] = None,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Bulk-create users from a CSV (email,password,full_name) or NDJSON body.
+    The format is taken from `format` or the Content-Type header.
+    Admin only endpoint.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if not format:
+        content_type = request.headers.get("content-type", "")
+        format = "ndjson" if "json" in content_type else "csv"
+    
+    payload = (await request.body()).decode("utf-8-sig")
+    try:
+        records = bulk_import.parse_records(payload, format)
+    except bulk_import.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if len(records) > bulk_import.IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Too many rows (max {bulk_import.IMPORT_MAX_ROWS})")
+    
+    # Hashing and inserts are blocking work; keep them off the event loop
+    report = await run_in_threadpool(bulk_import.import_users, db, records)
+    user_search.invalidate_user_caches()
+    return report
+
 @app.put("/admin/users/{user_id}", response_model=schemas.User)
 def update_user(
     user_id: int,
@@ -346,16 +486,19 @@ def update_user(
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = db_writer.run_as(db, apply_user_update, user_id, user_update.model_dump(exclude_unset=True))
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
-        
-    update_data = user_update.model_dump(exclude_unset=True)
+    user_search.invalidate_user_caches()
+    return db_user
+
+def apply_user_update(db: Session, user_id: int, update_data: dict) -> Optional[models.User]:
+    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not db_user:
+        return None
     for key, value in update_data.items():
         setattr(db_user, key, value)
-        
-    db.commit()
-    db.refresh(db_user)
+    db.flush()
     return db_user
 
 @app.delete("/admin/users/{user_id}")
@@ -370,14 +513,67 @@ def delete_user(
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
         
+    if not db_writer.run_as(db, remove_user, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    user_search.invalidate_user_caches()
+    
+    return {"success": True, "message": "User deleted successfully"}
+
+def remove_user(db: Session, user_id: int) -> bool:
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
     if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-        
+        return False
     db.delete(db_user)
-    db.commit()
+    return True
+
+def _bulk_conditions(selection: schemas.BulkUserSelection) -> list:
+    conditions = user_search.user_filter_conditions(selection.ids, selection.filter)
+    if not conditions:
+        raise HTTPException(status_code=400, detail="Provide 'ids' or a non-empty 'filter'")
+    return conditions
+
+@app.post("/admin/users/bulk-update", response_model=schemas.BulkOperationResult)
+def bulk_update_users(
+    bulk: schemas.BulkUserUpdate,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Apply the same patch to every selected user with a single UPDATE. Admin only.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    return {"success": True, "message": "User deleted successfully"}
+    update_data = bulk.patch.model_dump(exclude_unset=True)
+    if not update_data:
+        raise HTTPException(status_code=400, detail="Empty patch")
+    
+    affected = db_writer.run_as(db, update_users_where, _bulk_conditions(bulk), update_data)
+    user_search.invalidate_user_caches()
+    return {"success": True, "affected": affected}
+
+@app.post("/admin/users/bulk-delete", response_model=schemas.BulkOperationResult)
+def bulk_delete_users(
+    bulk: schemas.BulkUserSelection,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Delete every selected user with a single DELETE. Admin only.
+    The calling admin is never deleted.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    affected = db_writer.run_as(db, delete_users_where, _bulk_conditions(bulk) + [models.User.id != current_user.id])
+    user_search.invalidate_user_caches()
+    return {"success": True, "affected": affected}
+
+def update_users_where(db: Session, conditions: list, update_data: dict) -> int:
+    return db.query(models.User).filter(*conditions).update(update_data, synchronize_session=False)
+
+def delete_users_where(db: Session, conditions: list) -> int:
+    return db.query(models.User).filter(*conditions).delete(synchronize_session=False)
 
 
 @app.post("/admin/broadcast")
@@ -387,43 +583,53 @@ def broadcast_message(
     db: Session = Depends(database.get_db)
 ):
     """
-    Send a broadcast message to a group of users.
+    Queue a broadcast message to a group of users.
+    Emails are sent by a background job; poll /admin/broadcast/{job_id} for progress.
     Admin only endpoint.
     """
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Base query
-    query = db.query(models.User)
-    
-    # Filter by target
-    if broadcast.target == 'premium':
-        query = query.filter(models.User.is_premium == True)
-    elif broadcast.target == 'admin':
-        query = query.filter(models.User.is_admin == True)
+    total = recipients_query(db, broadcast.target).count()
     
-    users = query.all()
-    
-    if not users:
+    if not total:
         return {"success": False, "message": "No users found for this target"}
     
-    # Send emails (using email service with ElectrIA template)
-    success_count = 0
-    for user in users:
-        if email_service.send_broadcast_email(
-            email=user.email,
-            subject=broadcast.subject,
-            message=broadcast.message,
-            user_name=user.full_name
-        ):
-            success_count += 1
+    job = broadcast_jobs.submit(
+        subject=broadcast.subject,
+        message=broadcast.message,
+        target=broadcast.target,
+        total=total
+    )
     
     return {
         "success": True, 
-        "message": f"Mensaje de ElectrIA enviado desde {email_service.sender_email} exitosamente a {success_count} usuarios.",
-        "count": success_count
+        "message": f"Mensaje de ElectrIA en cola desde {email_service.sender_email} para {total} usuarios.",
+        "count": total,
+        "job_id": job.id
     }
 
+@app.get("/admin/broadcast", response_model=list[schemas.BroadcastJobStatus])
+def list_broadcast_jobs(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Recent broadcast jobs, newest first. Admin only.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return [job.to_dict() for job in broadcast_jobs.list()]
+
+@app.get("/admin/broadcast/{job_id}", response_model=schemas.BroadcastJobStatus)
+def get_broadcast_job(job_id: str, current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Progress and failure counts of a broadcast job. Admin only.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = broadcast_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Broadcast job not found")
+    return job.to_dict()
+
 @app.post("/analytics/visit")
 async def record_visit(request: Request, visit: schemas.VisitCreate, db: Session = Depends(database.get_db)):
     # Try to identify user from Authorization header if present
@@ -434,30 +640,45 @@ async def record_visit(request: Request, visit: schemas.VisitCreate, db: Session
             token = auth_header.split(" ")[1]
             email = auth.get_user_from_token(token)
             if email:
-                user = db.query(models.User).filter(models.User.email == email).first()
-                if user:
-                    user_id = user.id
+                # Blocking query (it may wait for a pool connection): off the event
+                # loop, which must stay free to deliver the writer's results
+                user_id = await run_in_threadpool(
+                    lambda: db.query(models.User.id).filter(models.User.email == email).scalar()
+                )
+                if user_id:
                     # Increment visit_count on each page visit (new session/page load)
-                    user.visit_count = (user.visit_count or 0) + 1
-                    db.commit()
+                    visit_counter.increment(user_id)
     except Exception as e:
-        logger.warning(f"Failed to identify user in record_visit: {e}")
+        logger.warning("Failed to identify user in record_visit: %s", e)
+
+    if db_writer.running:
+        # Queued to the serialized writer (SQLite): awaited without blocking the loop
+        visit_id = await asyncio.wrap_future(
+            db_writer.submit_as(db, insert_visit, visit.session_id, visit.path, user_id)
+        )
+    else:
+        # Inline write on this request's session: blocking, so off the event loop
+        visit_id = await run_in_threadpool(
+            db_writer.run_as, db, insert_visit, visit.session_id, visit.path, user_id
+        )
+    payload_versions.bump("visits")
+    visit_logger.info("👣 Visit %s on %s (user %s)", visit_id, visit.path, user_id)
+    return {"visit_id": visit_id}
 
+def insert_visit(db: Session, session_id: str, path: str, user_id: Optional[int]) -> int:
     new_visit = models.PageVisit(
-        session_id=visit.session_id,
-        path=visit.path,
+        session_id=session_id,
+        path=path,
         user_id=user_id
     )
     db.add(new_visit)
-    db.commit()
-    db.refresh(new_visit)
-    return {"visit_id": new_visit.id}
+    db.flush()
+    return new_visit.id
 
-@app.post("/analytics/heartbeat/{visit_id}")
-def heartbeat(visit_id: int, db: Session = Depends(database.get_db)):
+def record_heartbeat(db: Session, visit_id: int) -> bool:
     visit = db.query(models.PageVisit).filter(models.PageVisit.id == visit_id).first()
     if not visit:
-        raise HTTPException(status_code=404, detail="Visit not found")
+        return False
     
     now = datetime.utcnow()
     visit.last_heartbeat = now
@@ -465,16 +686,30 @@ def heartbeat(visit_id: int, db: Session = Depends(database.get_db)):
     # Update duration
     delta = now - visit.timestamp
     visit.duration_seconds = int(delta.total_seconds())
-    
-    db.commit()
+    return True
+
+@app.post("/analytics/heartbeat/{visit_id}")
+def heartbeat(visit_id: int):
+    if not db_writer.run(record_heartbeat, visit_id):
+        raise HTTPException(status_code=404, detail="Visit not found")
+    payload_versions.bump("visits")
+    visit_logger.info("💓 Heartbeat %s", visit_id)
     return {"status": "ok"}
 
+# Upstream endpoints (overridable so load tests can point them at local stubs)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+BCV_RAFNIXG_URL = os.getenv("BCV_RAFNIXG_URL", "https://bcv-api.rafnixg.dev/rates/")
+BCV_DOLARVZLA_URL = os.getenv("BCV_DOLARVZLA_URL", "https://api.dolarvzla.com/public/exchange-rate")
+BCV_SCRAPE_URL = os.getenv("BCV_SCRAPE_URL", "https://www.bcv.org.ve/")
+
 @app.post("/generate-content")
 async def generate_content_proxy(request: Request):
     """
     Secure proxy for Gemini AI API calls.
     Uses ONLY Gemini (Google) as the AI provider.
     """
+    import requests  # Lazy: only needed by the upstream proxies, keeps cold start lean
+    
     try:
         body = await request.json()
         errors_log = []
@@ -501,38 +736,43 @@ async def generate_content_proxy(request: Request):
         for model_name in models_to_try:
             try:
                 # Use v1beta endpoint which supports all current models
-                url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={gemini_key}"
+                url = f"{GEMINI_API_BASE}/v1beta/models/{model_name}:generateContent?key={gemini_key}"
                 
-                logger.info(f"📡 Intentando modelo: {model_name}")
+                logger.info("📡 Intentando modelo: %s", model_name)
                 
-                google_response = requests.post(
-                    url, 
-                    json=body, 
-                    headers={"Content-Type": "application/json"}, 
-                    timeout=90
-                )
+                with tracing.span("upstream gemini", kind="client", model=model_name) as span, \
+                        metrics.time_upstream("gemini", model_name) as call:
+                    # Blocking client: run it in the threadpool so the event loop keeps serving
+                    google_response = await run_in_threadpool(
+                        requests.post,
+                        url, 
+                        json=body, 
+                        headers={"Content-Type": "application/json"}, 
+                        timeout=90
+                    )
+                    call.outcome = google_response.status_code
+                    if span:
+                        span.set("http.status_code", google_response.status_code)
                 
                 if google_response.status_code == 200:
-                    logger.info(f"✅ {model_name} respondió exitosamente")
-                    return JSONResponse(
-                        content=google_response.json(),
-                        media_type="application/json"
-                    )
+                    logger.info("✅ %s respondió exitosamente", model_name)
+                    # Pass Gemini's bytes through as-is (no decode / re-encode)
+                    return raw_json_response(google_response.content)
                 else:
                     error_detail = google_response.text[:300] if google_response.text else "Sin detalles"
                     errors_log.append(f"{model_name}: {google_response.status_code} - {error_detail}")
-                    logger.warning(f"⚠️ {model_name} falló: {google_response.status_code}")
+                    logger.warning("⚠️ %s falló: %s", model_name, google_response.status_code)
                     
             except requests.exceptions.Timeout:
                 errors_log.append(f"{model_name}: Timeout")
-                logger.warning(f"⏱️ {model_name} timeout")
+                logger.warning("⏱️ %s timeout", model_name)
             except Exception as e:
                 errors_log.append(f"{model_name}: {str(e)[:100]}")
-                logger.error(f"❌ {model_name} error: {str(e)}")
+                logger.error("❌ %s error: %s", model_name, e)
         
         # All models failed
         error_summary = " | ".join(errors_log)
-        logger.error(f"🚫 Todos los modelos Gemini fallaron: {error_summary}")
+        logger.error("🚫 Todos los modelos Gemini fallaron: %s", error_summary)
         raise HTTPException(
             status_code=503, 
             detail=f"ElectrIA temporalmente no disponible. Errores: {error_summary}"
@@ -541,7 +781,7 @@ async def generate_content_proxy(request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"🚫 Error inesperado en ElectrIA: {str(e)}")
+        logger.error("🚫 Error inesperado en ElectrIA: %s", e)
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
 @app.get("/health/email")
@@ -578,26 +818,30 @@ def check_ai_health():
         "message": "ElectrIA is ready" if is_operational else "GEMINI_API_KEY not configured"
     }
 
-@app.get("/api/bcv")
-def get_bcv_rate():
+def fetch_bcv_rate():
     """
     Fetch the BCV (Banco Central de Venezuela) exchange rate.
     Uses multiple reliable APIs with fallbacks to ensure daily updates.
     Priority: 1) bcv-api.rafnixg.dev 2) api.dolarvzla.com 3) Direct BCV scrape 4) Fallback
     """
+    import requests  # Lazy: only needed by the upstream proxies, keeps cold start lean
+    
     errors_log = []
     
     # Source 1: BCV API by rafnixg (most reliable, dedicated BCV scraper)
     try:
         logger.info("📡 Intentando API bcv-api.rafnixg.dev...")
-        resp = requests.get("https://bcv-api.rafnixg.dev/rates/", timeout=10)
+        with tracing.span("upstream bcv", kind="client", source="rafnixg"), \
+                metrics.time_upstream("bcv", "rafnixg") as call:
+            resp = requests.get(BCV_RAFNIXG_URL, timeout=10)
+            call.outcome = resp.status_code
         
         if resp.status_code == 200:
             data = resp.json()
             # API returns: {"dollar": 367.30, "date": "2026-01-29"}
             if "dollar" in data:
                 rate = float(data["dollar"])
-                logger.info(f"✅ bcv-api.rafnixg.dev: {rate}")
+                logger.info("✅ bcv-api.rafnixg.dev: %s", rate)
                 return {
                     "rate": rate,
                     "source": "BCV Oficial (API rafnixg)",
@@ -606,7 +850,7 @@ def get_bcv_rate():
             # Alternative format: {"rates": {"USD": 55.12}}
             elif "rates" in data and "USD" in data["rates"]:
                 rate = float(data["rates"]["USD"])
-                logger.info(f"✅ bcv-api.rafnixg.dev (alt): {rate}")
+                logger.info("✅ bcv-api.rafnixg.dev (alt): %s", rate)
                 return {
                     "rate": rate,
                     "source": "BCV Oficial (API rafnixg)",
@@ -615,12 +859,15 @@ def get_bcv_rate():
         errors_log.append(f"rafnixg: {resp.status_code}")
     except Exception as e:
         errors_log.append(f"rafnixg: {str(e)[:50]}")
-        logger.warning(f"⚠️ bcv-api.rafnixg.dev falló: {str(e)}")
+        logger.warning("⚠️ bcv-api.rafnixg.dev falló: %s", e)
 
     # Source 2: DolarVZLA API (public, high rate limit)
     try:
         logger.info("📡 Intentando API api.dolarvzla.com...")
-        resp = requests.get("https://api.dolarvzla.com/public/exchange-rate", timeout=10)
+        with tracing.span("upstream bcv", kind="client", source="dolarvzla"), \
+                metrics.time_upstream("bcv", "dolarvzla") as call:
+            resp = requests.get(BCV_DOLARVZLA_URL, timeout=10)
+            call.outcome = resp.status_code
         
         if resp.status_code == 200:
             data = resp.json()
@@ -629,7 +876,7 @@ def get_bcv_rate():
                 # Format: {"bcv": {"usd": 55.12, ...}, "paralelo": {...}}
                 if "bcv" in data and "usd" in data["bcv"]:
                     rate = float(data["bcv"]["usd"])
-                    logger.info(f"✅ dolarvzla.com (bcv): {rate}")
+                    logger.info("✅ dolarvzla.com (bcv): %s", rate)
                     return {
                         "rate": rate,
                         "source": "BCV Oficial (DolarVZLA API)",
@@ -638,7 +885,7 @@ def get_bcv_rate():
                 # Alternative: direct USD field
                 elif "usd" in data:
                     rate = float(data["usd"])
-                    logger.info(f"✅ dolarvzla.com: {rate}")
+                    logger.info("✅ dolarvzla.com: %s", rate)
                     return {
                         "rate": rate,
                         "source": "BCV Oficial (DolarVZLA)",
@@ -647,7 +894,7 @@ def get_bcv_rate():
         errors_log.append(f"dolarvzla: {resp.status_code}")
     except Exception as e:
         errors_log.append(f"dolarvzla: {str(e)[:50]}")
-        logger.warning(f"⚠️ api.dolarvzla.com falló: {str(e)}")
+        logger.warning("⚠️ api.dolarvzla.com falló: %s", e)
 
     # Source 3: Direct Scrape from BCV Official (fallback due to SSL/JS issues)
     try:
@@ -660,52 +907,31 @@ def get_bcv_rate():
             'Pragma': 'no-cache'
         }
         
-        bcv_resp = requests.get("https://www.bcv.org.ve/", headers=headers, timeout=15, verify=False)
+        with tracing.span("upstream bcv", kind="client", source="bcv_scrape"), \
+                metrics.time_upstream("bcv", "bcv_scrape") as call:
+            bcv_resp = requests.get(BCV_SCRAPE_URL, headers=headers, timeout=15, verify=False)
+            call.outcome = bcv_resp.status_code
         
         if bcv_resp.status_code == 200:
-            import re
-            html_content = bcv_resp.text
-            
-            # Pattern 1: Standard ID 'dolar' with strong tag (handling classes/attributes in strong)
-            match = re.search(r'id=["\']dolar["\'].*?strong[^>]*>\s*([\d,.]+)\s*<', html_content, re.DOTALL | re.IGNORECASE)
-            
-            # Pattern 2: Search for USD text near a number
-            if not match:
-                match = re.search(r'USD.*?strong[^>]*>\s*([\d,.]+)\s*<', html_content, re.DOTALL | re.IGNORECASE)
-            
-            # Pattern 3: Look for strong tags with rate-like values (50-1000 range for current BCV)
-            if not match:
-                potentials = re.findall(r'strong[^>]*>\s*([\d]{1,4},[\d]+)\s*<', html_content)
-                if potentials:
-                    # BCV order is EUR, CNY, TRY, RUB, USD (USD is usually last)
-                    rate_str = potentials[-1].replace(',', '.')
-                    rate = float(rate_str)
-                    logger.info(f"✅ BCV Scrape (patrón secundario): {rate}")
-                    return {
-                        "rate": rate,
-                        "source": "BCV Oficial (Scrape Directo)",
-                        "updated_at": datetime.utcnow().isoformat()
-                    }
-
-            if match:
-                rate_str = match.group(1).replace(',', '.')
-                rate = float(rate_str)
-                logger.info(f"✅ BCV Scrape Exitoso: {rate}")
+            parsed = parse_bcv_html(bcv_resp.text)
+            if parsed:
+                rate, source = parsed
+                logger.info("✅ BCV Scrape Exitoso (%s): %s", source, rate)
                 return {
                     "rate": rate,
-                    "source": "BCV Oficial (Scrape en Tiempo Real)",
+                    "source": source,
                     "updated_at": datetime.utcnow().isoformat()
                 }
         errors_log.append(f"BCV scrape: {bcv_resp.status_code if 'bcv_resp' in dir() else 'failed'}")
     except Exception as e:
         errors_log.append(f"BCV scrape: {str(e)[:50]}")
-        logger.warning(f"⚠️ BCV Scrape falló: {str(e)}")
+        logger.warning("⚠️ BCV Scrape falló: %s", e)
 
     # Source 4: Hardcoded Fallback (last resort, needs manual update when all APIs fail)
     # IMPORTANT: Update this value periodically when APIs are unavailable
     # Last Manual Update: 07-Jun-2026
     current_fixed_rate = 567.68  # Updated to current BCV rate
-    logger.warning(f"⚠️ Todas las APIs fallaron, usando tasa de respaldo: {current_fixed_rate}. Errores: {errors_log}")
+    logger.warning("⚠️ Todas las APIs fallaron, usando tasa de respaldo: %s. Errores: %s", current_fixed_rate, errors_log)
     return {
         "rate": current_fixed_rate,
         "source": "Sistema Electromatics (Respaldo 07-Jun-2026)",
@@ -713,6 +939,42 @@ def get_bcv_rate():
         "warning": "Tasa de respaldo - APIs no disponibles temporalmente"
     }
 
+# Server-side cache of the BCV rate; fallback values are retried sooner
+BCV_CACHE_SECONDS = int(os.getenv("BCV_CACHE_SECONDS", "600"))
+BCV_FALLBACK_CACHE_SECONDS = 60
+bcv_cache = make_cache(ttl=BCV_CACHE_SECONDS, max_entries=1, name="bcv")
+
+@app.get("/metrics")
+def read_metrics(request: Request):
+    """
+    Prometheus scrape endpoint (text exposition format).
+    Protected by METRICS_TOKEN when it is set.
+    """
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/health/startup")
+def check_startup_profile():
+    """
+    Cold-start profile of this worker (imports, migrations, pool warm-up).
+    """
+    return startup_profile.report()
+
+@app.get("/api/bcv")
+def get_bcv_rate():
+    """
+    BCV exchange rate, fetched at most once per BCV_CACHE_SECONDS.
+    """
+    rate = bcv_cache.get("rate")
+    if rate is None:
+        rate = fetch_bcv_rate()
+        ttl = BCV_FALLBACK_CACHE_SECONDS if "warning" in rate else BCV_CACHE_SECONDS
+        bcv_cache.set("rate", rate, ttl=ttl)
+        # The ETag version expires with the cached value
+        payload_versions.bump("bcv", ttl=ttl)
+    return rate
+
 @app.get("/")
 def read_root():
     return {"message": "Electromatics API is running"}
@@ -0,0 +1,189 @@
+"""
+ASGI Middleware Module
+Pure ASGI middlewares (no BaseHTTPMiddleware): CORS and JSON response compression
+"""
+import os
+import gzip
+import json
+import logging
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip is offered without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"*"),
+    (b"access-control-allow-headers", b"*"),
+]
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+
+def parse_accept_encoding(value: bytes) -> dict:
+    """
+    {coding: q} from an Accept-Encoding value, e.g. b"gzip;q=0.5, br" ->
+    {"gzip": 0.5, "br": 1.0}. Malformed q-values count as 0 (not acceptable).
+    """
+    codings = {}
+    for item in value.decode("latin-1").lower().split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = min(1.0, max(0.0, float(number)))
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class CORSMiddleware:
+    """
+    Answers preflight requests without touching the app and adds the CORS
+    headers to every response at http.response.start (streaming-safe).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS":
+            await send({"type": "http.response.start", "status": 204, "headers": list(CORS_HEADERS)})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        response_started = False
+
+        async def send_with_cors(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                headers = [
+                    (name, value) for name, value in message.get("headers", [])
+                    if not name.lower().startswith(b"access-control-allow-")
+                ]
+                message["headers"] = headers + CORS_HEADERS
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cors)
+        except Exception as e:
+            if response_started:
+                raise
+            # Errors must carry CORS headers too, or the browser hides the detail
+            logger.exception("❌ Unhandled error on %s: %s", scope.get("path"), e)
+            body = json.dumps({"detail": str(e)}).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 500,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                ] + CORS_HEADERS,
+            })
+            await send({"type": "http.response.body", "body": body})
+
+
+class CompressionMiddleware:
+    """
+    Compresses complete (non-streaming) JSON responses above `minimum_size`
+    with brotli when available and accepted, otherwise gzip.
+    Streaming and non-JSON responses pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, scope):
+        """The supported coding with the highest q-value (brotli on ties), or None"""
+        values = [value for name, value in scope.get("headers", []) if name == b"accept-encoding"]
+        if not values:
+            return None
+        accepted = parse_accept_encoding(b",".join(values))
+        wildcard = accepted.get("*", 0.0)
+        best, best_q = None, 0.0
+        for coding in ("br", "gzip") if brotli is not None else ("gzip",):
+            q = accepted.get(coding, wildcard)
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._choose_encoding(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"")
+                if b"json" not in content_type or b"content-encoding" in headers:
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Hold the start message until we know the body size
+                    start_message = message
+                return
+
+            if message["type"] == "http.response.body" and start_message is not None:
+                body = message.get("body", b"")
+                if message.get("more_body", False) or len(body) < self.minimum_size:
+                    # Streaming or small: send as-is
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                if encoding == "br":
+                    compressed = brotli.compress(body, quality=self.brotli_quality)
+                else:
+                    compressed = gzip.compress(body, compresslevel=self.gzip_level)
+
+                vary = [b"Accept-Encoding"]
+                headers = []
+                for name, value in start_message.get("headers", []):
+                    if name.lower() == b"vary":
+                        vary.insert(0, value)
+                    elif name.lower() != b"content-length":
+                        headers.append((name, value))
+                headers += [
+                    (b"content-encoding", encoding.encode("ascii")),
+                    (b"content-length", str(len(compressed)).encode("ascii")),
+                    (b"vary", b", ".join(vary)),
+                ]
+                start_message["headers"] = headers
+                await send(start_message)
+                await send({"type": "http.response.body", "body": compressed})
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -1,94 +1,234 @@
 from sqlalchemy import text, inspect
+from sqlalchemy.schema import CreateIndex
+from datetime import datetime
+import hashlib
 import logging
+import structured_logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (queued JSON records, see structured_logging.py)
+structured_logging.configure()
 logger = logging.getLogger(__name__)
 
-def run_migrations(engine):
+# Arbitrary key for pg_advisory_xact_lock so concurrent workers migrate one at a time
+MIGRATION_LOCK_ID = 7320461
+
+# Registered migrations: (version, name, function(conn), transactional)
+MIGRATIONS = []
+
+
+def register(version: int, name: str, fn, transactional: bool = True):
+    if any(v == version for v, _, _, _ in MIGRATIONS):
+        raise ValueError(f"Duplicate migration version {version}")
+    MIGRATIONS.append((version, name, fn, transactional))
+    MIGRATIONS.sort(key=lambda m: m[0])
+
+
+def migration(version: int, name: str, transactional: bool = True):
+    """
+    Register a schema migration. Versions must be unique and only ever appended.
+    Non-transactional migrations run on an AUTOCOMMIT connection (needed for
+    CREATE INDEX CONCURRENTLY) and must be idempotent, since a failure part-way
+    leaves earlier statements applied.
+    """
+    def decorator(fn):
+        register(version, name, fn, transactional)
+        return fn
+    return decorator
+
+
+def index_migration(version: int, name: str, index_names: tuple):
+    """
+    Register a migration that builds indexes declared on the models (by name).
+    Fresh databases get them from create_all; this brings existing tables up to date.
+    """
+    def build(conn):
+        import models
+        indexes = {
+            index.name: index
+            for table in models.Base.metadata.tables.values()
+            for index in table.indexes
+        }
+        for index_name in index_names:
+            create_index(conn, indexes[index_name])
+    register(version, name, build, transactional=False)
+
+
+def _pg_index_valid(conn, name: str):
+    """True / False for an existing index (False = failed concurrent build), None if absent"""
+    return conn.execute(text(
+        "SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+        "WHERE c.relname = :name"
+    ), {"name": name}).scalar()
+
+
+def create_index(conn, index) -> bool:
+    """
+    Idempotently create a model-declared index. On PostgreSQL it is built
+    CONCURRENTLY so writes to the table are not blocked, and an INVALID index
+    left by an interrupted build is dropped and rebuilt.
+    Returns True when the index was (re)built.
+    """
+    if conn.dialect.name == "postgresql":
+        valid = _pg_index_valid(conn, index.name)
+        if valid:
+            return False
+        if valid is False:
+            logger.warning("⚠️ Index %s is INVALID (interrupted build), rebuilding", index.name)
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+        ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+        ddl = ddl.replace("INDEX ", "INDEX CONCURRENTLY ", 1)
+        logger.info("Building index %s concurrently...", index.name)
+        conn.execute(text(ddl))
+        return True
+
+    if index.name in {i["name"] for i in inspect(conn).get_indexes(index.table.name)}:
+        return False
+    logger.info("Building index %s...", index.name)
+    conn.execute(CreateIndex(index, if_not_exists=True))
+    return True
+
+
+@migration(1, "legacy_user_columns")
+def add_legacy_user_columns(conn):
     """
     Checks for missing columns in the 'users' table and adds them if necessary.
-    This is a lightweight migration system for SQLite and PostgreSQL.
+    Databases created before these columns existed need them; fresh ones already have them.
     """
+    columns = [c['name'] for c in inspect(conn).get_columns("users")]
+    logger.info("Existing columns in 'users': %s", columns)
+
+    new_columns = [
+        ("is_admin", "BOOLEAN DEFAULT FALSE"),
+        ("is_premium", "BOOLEAN DEFAULT FALSE"),
+        ("email_verified", "BOOLEAN DEFAULT FALSE"),
+        ("verification_token", "VARCHAR"),
+        ("verification_token_expires", "TIMESTAMP"),
+        ("created_at", "TIMESTAMP"),
+        ("visit_count", "INTEGER DEFAULT 0"),
+    ]
+    for name, ddl in new_columns:
+        if name not in columns:
+            logger.info("Migrating: Adding %s column", name)
+            conn.execute(text(f"ALTER TABLE users ADD COLUMN {name} {ddl}"))
+
+    # Ensure no NULL created_at
+    conn.execute(text("UPDATE users SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"))
+
+
+@migration(2, "user_search_indexes")
+def create_user_search_indexes(conn):
+    import user_search
+    user_search.create_search_indexes(conn)
+
+
+index_migration(3, "hot_lookup_indexes", (
+    "ix_users_verification_token",
+    "ix_page_visits_heartbeat_session",
+    "ix_page_visits_path_id",
+    "ix_page_visits_timestamp",
+))
+
+
+def schema_fingerprint(metadata) -> str:
+    """Hash of the declared tables/columns/indexes plus the migration list"""
+    parts = []
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        parts.append(f"table {table.name}")
+        for column in table.columns:
+            parts.append(f"  {column.name} {column.type} nullable={column.nullable}")
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            parts.append(f"  index {index.name} {[c.name for c in index.columns]}")
+    for version, name, _, _ in MIGRATIONS:
+        parts.append(f"migration {version} {name}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def ensure_migrations_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, "
+            "name VARCHAR NOT NULL, "
+            "fingerprint VARCHAR, "
+            "applied_at TIMESTAMP)"
+        ))
+
+
+def stored_fingerprint(engine):
+    """Fingerprint recorded by the last successful run, or None (one cheap query)"""
     try:
-        inspector = inspect(engine)
-        
-        # Check if users table exists
-        if not inspector.has_table("users"):
-            logger.info("Users table does not exist. Skipping migrations (create_all will handle it).")
-            return
-
-        columns = [c['name'] for c in inspector.get_columns("users")]
-        logger.info(f"Existing columns in 'users': {columns}")
-        
-        with engine.begin() as conn:
-            # 1. is_admin
-            if "is_admin" not in columns:
-                try:
-                    logger.info("Migrating: Adding is_admin column")
-                    conn.execute(text("ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT FALSE"))
-                except Exception as e:
-                    logger.error(f"Failed to add is_admin: {e}")
-            
-            # 2. is_premium
-            if "is_premium" not in columns:
-                try:
-                    logger.info("Migrating: Adding is_premium column")
-                    conn.execute(text("ALTER TABLE users ADD COLUMN is_premium BOOLEAN DEFAULT FALSE"))
-                except Exception as e:
-                    logger.error(f"Failed to add is_premium: {e}")
-                
-            # 3. email_verified
-            if "email_verified" not in columns:
-                try:
-                    logger.info("Migrating: Adding email_verified column")
-                    conn.execute(text("ALTER TABLE users ADD COLUMN email_verified BOOLEAN DEFAULT FALSE"))
-                except Exception as e:
-                    logger.error(f"Failed to add email_verified: {e}")
-                
-            # 4. verification_token
-            if "verification_token" not in columns:
-                try:
-                    logger.info("Migrating: Adding verification_token column")
-                    conn.execute(text("ALTER TABLE users ADD COLUMN verification_token VARCHAR"))
-                except Exception as e:
-                    logger.error(f"Failed to add verification_token: {e}")
+        with engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT fingerprint FROM schema_migrations WHERE version = 0"
+            )).scalar()
+    except Exception:
+        # Table does not exist yet (first boot)
+        return None
 
-            # 5. verification_token_expires
-            if "verification_token_expires" not in columns:
-                try:
-                    logger.info("Migrating: Adding verification_token_expires column")
-                    conn.execute(text("ALTER TABLE users ADD COLUMN verification_token_expires TIMESTAMP"))
-                except Exception as e:
-                    logger.error(f"Failed to add verification_token_expires: {e}")
 
-            # 6. created_at
-            if "created_at" not in columns:
-                try:
-                    logger.info("Migrating: Adding created_at column")
-                    conn.execute(text("ALTER TABLE users ADD COLUMN created_at TIMESTAMP"))
-                except Exception as e:
-                    logger.error(f"Failed to add created_at: {e}")
-            
-            # 7. visit_count
-            if "visit_count" not in columns:
+def _apply(conn, version: int, name: str, fn):
+    applied = conn.execute(
+        text("SELECT 1 FROM schema_migrations WHERE version = :v"), {"v": version}
+    ).first()
+    if applied:
+        return
+    logger.info("Migrating: %s %s", version, name)
+    fn(conn)
+    conn.execute(
+        text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+        {"v": version, "n": name, "t": datetime.utcnow()}
+    )
+
+
+def run_migrations(engine, metadata, force: bool = False):
+    """
+    Versioned migration runner.
+    When the stored fingerprint matches the current models and migration list,
+    boot costs a single SELECT: no introspection, no create_all, no ALTERs.
+    Otherwise tables are created, pending migrations are applied in order
+    (each in its own transaction) and the new fingerprint is stored.
+    Returns True when work was done, False when the fast path was taken.
+    `force` skips the fingerprint check.
+    """
+    fingerprint = schema_fingerprint(metadata)
+    if not force and stored_fingerprint(engine) == fingerprint:
+        logger.info("✅ Schema fingerprint matches, skipping migrations")
+        return False
+
+    logger.info("🔧 Schema changed or first boot, running migrations...")
+    ensure_migrations_table(engine)
+    metadata.create_all(bind=engine)
+
+    # Session advisory locks would be taken and released on different server
+    # connections behind a transaction pooler; the index builds are idempotent
+    import database
+    session_lock = engine.dialect.name == "postgresql" and not database.TRANSACTION_POOLING
+
+    for version, name, fn, transactional in MIGRATIONS:
+        if transactional:
+            with engine.begin() as conn:
+                if engine.dialect.name == "postgresql":
+                    conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+                _apply(conn, version, name, fn)
+        else:
+            with engine.connect() as conn:
+                conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                if session_lock:
+                    conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
                 try:
-                    logger.info("Migrating: Adding visit_count column")
-                    conn.execute(text("ALTER TABLE users ADD COLUMN visit_count INTEGER DEFAULT 0"))
-                except Exception as e:
-                    logger.error(f"Failed to add visit_count: {e}")
-            
-            # Ensure no NULL created_at
-            try:
-                # Use COALESCE or simple UPDATE depending on DB support, 
-                # but plain UPDATE where NULL is safe for both SQLite and Postgres
-                conn.execute(text("UPDATE users SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"))
-                logger.info("Migrating: Populated NULL created_at values.")
-            except Exception as e:
-                logger.error(f"Failed to populate created_at: {e}")
-                
-            logger.info("Migrations check completed.")
-            
-    except Exception as e:
-        logger.error(f"Migration Error: {e}")
-        # Don't raise, so app can try to start anyway
+                    _apply(conn, version, name, fn)
+                finally:
+                    if session_lock:
+                        conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+    # Upsert: workers booting together may both reach this point
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO schema_migrations (version, name, fingerprint, applied_at) VALUES (0, 'fingerprint', :f, :t) "
+                "ON CONFLICT (version) DO UPDATE SET fingerprint = excluded.fingerprint, applied_at = excluded.applied_at"
+            ),
+            {"f": fingerprint, "t": datetime.utcnow()}
+        )
+    logger.info("Migrations check completed.")
+    return True
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, Index
 from database import Base
 from datetime import datetime
 
@@ -18,6 +18,15 @@ class User(Base):
     visit_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # verify-email lookup; only pending verifications carry a token
+        Index(
+            "ix_users_verification_token", "verification_token",
+            postgresql_where=verification_token.isnot(None),
+            sqlite_where=verification_token.isnot(None),
+        ),
+    )
+
 class PageVisit(Base):
     __tablename__ = "page_visits"
 
@@ -28,3 +37,30 @@ class PageVisit(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     last_heartbeat = Column(DateTime, default=datetime.utcnow)
     duration_seconds = Column(Integer, default=0)
+
+    __table_args__ = (
+        # Active sessions: range on last_heartbeat, DISTINCT session_id read from the index
+        Index("ix_page_visits_heartbeat_session", "last_heartbeat", "session_id"),
+        # Top pages: GROUP BY path, COUNT(id) answered from the index
+        Index("ix_page_visits_path_id", "path", "id"),
+        # Time-window rollups
+        Index("ix_page_visits_timestamp", "timestamp"),
+    )
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    recipient = Column(String)
+    subject = Column(String)
+    html_content = Column(Text)
+    status = Column(String, default="pending")  # 'pending', 'sending' (claimed), 'sent', 'failed'
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
@@ -0,0 +1,160 @@
+"""
+Email Outbox Module
+Transactional outbox: emails are stored with the business row and sent by a background worker
+"""
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+import models
+from db_writer import db_writer
+from email_service import email_service, SMTPConnectionPool
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+# A claimed batch must be sent within this time, or another drain takes it over
+# (a worker that died mid-batch); well above batch size x SMTP timeout
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "900"))
+# Retry delays: 30s, 60s, 120s, ... capped at one hour
+OUTBOX_BACKOFF_BASE_SECONDS = 30
+OUTBOX_BACKOFF_MAX_SECONDS = 3600
+
+
+def enqueue(db: Session, recipient: str, subject: str, html_content: str) -> models.EmailOutbox:
+    """
+    Adds an email to the outbox in the caller's transaction.
+    It is only sent once the caller commits.
+    """
+    message = models.EmailOutbox(
+        recipient=recipient,
+        subject=subject,
+        html_content=html_content,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.add(message)
+    return message
+
+
+def backoff_seconds(attempts: int) -> int:
+    return min(OUTBOX_BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)), OUTBOX_BACKOFF_MAX_SECONDS)
+
+
+OUTCOME_COLUMNS = ("attempts", "status", "sent_at", "last_error", "next_attempt_at")
+
+
+def claim_due(db: Session, batch_size: int) -> list:
+    """
+    Marks up to `batch_size` due messages as "sending" with a lease (in
+    next_attempt_at) and returns them as dicts. Due means pending and past
+    its retry time, or sending with an expired lease. The caller commits;
+    sending then happens outside any transaction.
+    """
+    now = datetime.utcnow()
+    query = db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.status.in_(("pending", "sending")),
+        models.EmailOutbox.next_attempt_at <= now
+    ).order_by(models.EmailOutbox.id).limit(batch_size)
+    if db.get_bind().dialect.name == "postgresql":
+        # Several workers can drain the same outbox without double-sending
+        query = query.with_for_update(skip_locked=True)
+    messages = query.all()
+    for message in messages:
+        message.status = "sending"
+        message.next_attempt_at = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+    return [
+        {
+            "id": message.id,
+            "recipient": message.recipient,
+            "subject": message.subject,
+            "html_content": message.html_content,
+            "attempts": message.attempts or 0,
+        }
+        for message in messages
+    ]
+
+
+def save_outcomes(db: Session, outcomes: list):
+    """Writes the send outcomes ({"id": ..., column: value}) with one UPDATE by primary key"""
+    if outcomes:
+        db.execute(update(models.EmailOutbox), outcomes)
+
+
+class OutboxWorker:
+    """Background thread that drains due outbox rows with retries and exponential backoff"""
+
+    def __init__(self, poll_interval: float = OUTBOX_POLL_SECONDS, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = SMTPConnectionPool(email_service, size=1)
+
+    def notify(self):
+        """Wake the worker right away (call after committing new outbox rows)"""
+        self._wake.set()
+
+    def drain_once(self) -> int:
+        """Send one batch of due messages. Returns how many were processed."""
+        try:
+            # Short transaction: the row locks are released before any SMTP call
+            messages = db_writer.run(claim_due, self.batch_size)
+            outcomes = []
+            for message in messages:
+                sent = email_service.send_email(message["recipient"], message["subject"], message["html_content"], pool=self._pool)
+                attempts = message["attempts"] + 1
+                outcome = {"id": message["id"], "attempts": attempts, "status": "pending",
+                           "sent_at": None, "last_error": None, "next_attempt_at": datetime.utcnow()}
+                if sent:
+                    outcome["status"] = "sent"
+                    outcome["sent_at"] = datetime.utcnow()
+                elif attempts >= OUTBOX_MAX_ATTEMPTS:
+                    outcome["status"] = "failed"
+                    outcome["last_error"] = "Max attempts reached"
+                    logger.error("❌ Outbox: giving up on email %s to %s", message["id"], message["recipient"])
+                else:
+                    delay = backoff_seconds(attempts)
+                    outcome["next_attempt_at"] += timedelta(seconds=delay)
+                    outcome["last_error"] = "Send failed"
+                    logger.warning("⚠️ Outbox: email %s failed, retry in %ss", message["id"], delay)
+                outcomes.append(outcome)
+            # Second short transaction; an unsent claim is retried once its lease expires
+            db_writer.run(save_outcomes, outcomes)
+            return len(messages)
+        except Exception as e:
+            logger.error("❌ Outbox drain failed: %s", e)
+            return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Keep going while full batches come back, then sleep until poked or polled
+            if self.drain_once() >= self.batch_size:
+                continue
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self._pool.close()
+
+
+# Global outbox worker
+outbox_worker = OutboxWorker()
@@ -0,0 +1,232 @@
+"""
+Pool Telemetry Module
+Connection-pool metrics (checkout wait, in-use, timeouts) collected from SQLAlchemy pool events
+"""
+import os
+import time
+import logging
+import threading
+import sqlalchemy
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Checkouts slower than this are logged (at most once per SLOW_CHECKOUT_LOG_INTERVAL)
+SLOW_CHECKOUT_MS = float(os.getenv("POOL_SLOW_CHECKOUT_MS", "500"))
+SLOW_CHECKOUT_LOG_INTERVAL = 10
+# Upper bounds (seconds) of the checkout wait histogram
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+# InstrumentedQueuePool overrides the private QueuePool._do_get, so it is only
+# installed on the SQLAlchemy versions it was checked against. Elsewhere pools
+# are plain QueuePools and get_db times its checkout with timed_checkout().
+CHECKED_SQLALCHEMY_VERSIONS = ("2.0", "2.1")
+WAIT_HOOK = (
+    os.getenv("POOL_WAIT_HOOK", "1") == "1"
+    and ".".join(sqlalchemy.__version__.split(".")[:2]) in CHECKED_SQLALCHEMY_VERSIONS
+    and callable(getattr(QueuePool, "_do_get", None))
+)
+
+
+class PoolTelemetry:
+    """
+    Counters for one engine's pool. Lifecycle counts come from pool events;
+    checkout wait time and timeouts from InstrumentedQueuePool, since
+    SQLAlchemy has no event before a checkout starts waiting (or, without
+    WAIT_HOOK, from timed_checkout()).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+        self._last_slow_log = 0.0
+
+    def attach(self, engine):
+        """Register the pool event listeners on `engine`"""
+        self.pool = engine.pool
+
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            with self._lock:
+                self.connects += 1
+
+        @event.listens_for(engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            with self._lock:
+                self.checkouts += 1
+                self.in_use += 1
+                self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+        @event.listens_for(engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            with self._lock:
+                self.checkins += 1
+                self.in_use = max(0, self.in_use - 1)
+
+        @event.listens_for(engine, "invalidate")
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            with self._lock:
+                self.invalidations += 1
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    self.wait_buckets[i] += 1
+                    break
+            log_slow = (
+                seconds * 1000 >= SLOW_CHECKOUT_MS
+                and time.monotonic() - self._last_slow_log >= SLOW_CHECKOUT_LOG_INTERVAL
+            )
+            if log_slow:
+                self._last_slow_log = time.monotonic()
+        if log_slow:
+            logger.warning(
+                "🐢 Pool '%s': checkout waited %.0fms (%s in use, size %s)",
+                self.name, seconds * 1000, self.in_use, self.pool.size() if self.pool else "?",
+            )
+
+    def record_timeout(self, seconds: float):
+        with self._lock:
+            self.timeouts += 1
+        logger.error("❌ Pool '%s': checkout timed out after %.1fs (%s in use)", self.name, seconds, self.in_use)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = {
+                "name": self.name,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "wait": {
+                    "count": self.wait_count,
+                    "avg_ms": round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                    "max_ms": round(self.wait_max * 1000, 3),
+                    "total_seconds": round(self.wait_total, 6),
+                    "buckets": {str(bound): count for bound, count in zip(WAIT_BUCKETS, self.wait_buckets)},
+                },
+            }
+        if isinstance(self.pool, QueuePool):
+            stats["size"] = self.pool.size()
+            stats["checked_out"] = self.pool.checkedout()
+            stats["overflow"] = self.pool.overflow()
+            stats["idle"] = self.pool.checkedin()
+        return stats
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited (and timeouts) to its telemetry"""
+
+    telemetry = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.telemetry.record_timeout(time.perf_counter() - start)
+            raise
+        self.telemetry.record_wait(time.perf_counter() - start)
+        return record
+
+
+_telemetry = {}
+
+
+def pool_class_for(name: str):
+    """
+    InstrumentedQueuePool subclass bound to the telemetry named `name`.
+    A subclass (not an attribute) so the binding survives pool.recreate().
+    Plain QueuePool when WAIT_HOOK is off.
+    """
+    telemetry = _telemetry.setdefault(name, PoolTelemetry(name))
+    if not WAIT_HOOK:
+        return QueuePool
+    return type("InstrumentedQueuePool", (InstrumentedQueuePool,), {"telemetry": telemetry})
+
+
+def timed_checkout(session, name: str):
+    """
+    Fallback when WAIT_HOOK is off (public API only): checks `session`'s
+    connection out right away and records how long it took. Includes any
+    pre-ping or new connect, so it over-estimates the pure queue wait.
+    """
+    telemetry = telemetry_for(name)
+    start = time.perf_counter()
+    try:
+        session.connection()
+    except exc.TimeoutError:
+        telemetry.record_timeout(time.perf_counter() - start)
+        raise
+    telemetry.record_wait(time.perf_counter() - start)
+
+
+def telemetry_for(name: str) -> PoolTelemetry:
+    return _telemetry.setdefault(name, PoolTelemetry(name))
+
+
+def snapshot_all() -> list:
+    return [telemetry.snapshot() for telemetry in _telemetry.values()]
+
+
+def collect_metrics():
+    """Prometheus families for every instrumented pool (see metrics.Registry)"""
+    pools = [(telemetry, telemetry.snapshot()) for telemetry in list(_telemetry.values())]
+    yield "db_pool_connections_in_use", "gauge", "Connections checked out of the pool", [
+        ("", {"pool": stats["name"]}, stats["in_use"]) for _, stats in pools
+    ]
+    yield "db_pool_size", "gauge", "Configured pool size", [
+        ("", {"pool": stats["name"]}, stats["size"]) for _, stats in pools if "size" in stats
+    ]
+    yield "db_pool_checkouts", "counter", "Pool checkouts", [
+        ("_total", {"pool": stats["name"]}, stats["checkouts"]) for _, stats in pools
+    ]
+    yield "db_pool_timeouts", "counter", "Checkouts that timed out waiting for a connection", [
+        ("_total", {"pool": stats["name"]}, stats["timeouts"]) for _, stats in pools
+    ]
+    yield "db_pool_invalidations", "counter", "Connections invalidated (e.g. failed pre-ping)", [
+        ("_total", {"pool": stats["name"]}, stats["invalidations"]) for _, stats in pools
+    ]
+    samples = []
+    for telemetry, stats in pools:
+        labels = {"pool": stats["name"]}
+        with telemetry._lock:
+            buckets = list(telemetry.wait_buckets)
+            count, total = telemetry.wait_count, telemetry.wait_total
+        cumulative = 0
+        for bound, bucket_count in zip(WAIT_BUCKETS, buckets):
+            cumulative += bucket_count
+            samples.append(("_bucket", {**labels, "le": str(float(bound))}, cumulative))
+        samples.append(("_bucket", {**labels, "le": "+Inf"}, count))
+        samples.append(("_sum", labels, total))
+        samples.append(("_count", labels, count))
+    yield "db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a pool connection", samples
+
+
+metrics.registry.add_collector(collect_metrics)
+
+if not WAIT_HOOK:
+    logger.warning(
+        "⚠️ Pool wait hook disabled (SQLAlchemy %s): checkout waits are timed in get_db", sqlalchemy.__version__
+    )
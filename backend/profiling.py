@@ -0,0 +1,295 @@
+"""
+Profiling Module
+On-demand sampling profiler for endpoints, saved as speedscope / collapsed-stack files in an on-disk ring
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import inspect
+import logging
+import functools
+import threading
+from datetime import datetime
+from contextvars import ContextVar
+from fastapi.routing import APIRoute
+from fastapi.concurrency import run_in_threadpool
+import auth, database, models
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+# Oldest profiles are deleted beyond this many files
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+# Fraction of requests profiled without asking (0 = only on demand)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+PROFILE_MAX_DEPTH = 128
+PROFILE_HEADER = b"x-profile"
+FORMATS = ("speedscope", "collapsed")
+
+
+class RequestProfile:
+    """Samples collected for one request (filled by the profiled endpoint)"""
+
+    def __init__(self, fmt: str, reason: str):
+        self.format = fmt
+        self.reason = reason
+        self.started = time.perf_counter()
+        self.route = None
+        self.samples = []  # (stack tuple of (name, file, line), weight seconds)
+        self.elapsed = 0.0
+
+
+_active = ContextVar("request_profile", default=None)
+
+
+class StackSampler:
+    """
+    Samples one thread's stack every `interval` seconds, keeping only the frames
+    above the profiled endpoint wrapper. Samples where the wrapper is not on the
+    stack (an async endpoint suspended at an await) are not attributed to it.
+    """
+
+    def __init__(self, thread_id: int, boundary_code, interval: float):
+        self.thread_id = thread_id
+        self.boundary_code = boundary_code
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _stack(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+            if frame.f_code is self.boundary_code:
+                return tuple(reversed(stack))
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, frame.f_lineno))
+            frame = frame.f_back
+        return None
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            stack = self._stack()
+            now = time.perf_counter()
+            if stack:
+                self.samples.append((stack, now - last))
+            last = now
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def profiled(endpoint):
+    """Wrap an endpoint so it is sampled when its request is being profiled"""
+    interval = PROFILE_INTERVAL_MS / 1000
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            profile = _active.get()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            with StackSampler(threading.get_ident(), async_wrapper_code, interval) as sampler:
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    profile.samples.extend(sampler.samples)
+        async_wrapper_code = async_wrapper.__code__
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def sync_wrapper(*args, **kwargs):
+        profile = _active.get()
+        if profile is None:
+            return endpoint(*args, **kwargs)
+        with StackSampler(threading.get_ident(), sync_wrapper.__code__, interval) as sampler:
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                profile.samples.extend(sampler.samples)
+    return sync_wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """Route class that makes every endpoint profileable (app.router.route_class)"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+
+def _frame_name(frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def to_speedscope(profile: RequestProfile, title: str) -> bytes:
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, weight in profile.samples:
+        ids = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            ids.append(index[frame])
+        samples.append(ids)
+        weights.append(round(weight * 1000, 3))
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": title,
+        "exporter": "electromatics-backend",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": title,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": round(sum(weights), 3),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+    return json.dumps(document).encode("utf-8")
+
+
+def to_collapsed(profile: RequestProfile) -> bytes:
+    """Brendan Gregg's folded format: 'root;child;leaf <microseconds>' per unique stack"""
+    totals = {}
+    for stack, weight in profile.samples:
+        key = ";".join(_frame_name(frame).replace(";", ":") for frame in stack)
+        totals[key] = totals.get(key, 0) + weight
+    lines = [f"{stack} {int(seconds * 1_000_000)}" for stack, seconds in totals.items()]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class ProfileStore:
+    """Bounded ring of profile files in PROFILE_DIR (oldest deleted first)"""
+
+    SUFFIXES = {"speedscope": ".speedscope.json", "collapsed": ".collapsed.txt"}
+    NAME_PATTERN = re.compile(r"^[\w.\-]+$")
+
+    def __init__(self, directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def save(self, profile: RequestProfile) -> str:
+        route = re.sub(r"[^\w]+", "_", profile.route or "unknown").strip("_") or "root"
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        name = f"{stamp}_{route}_{profile.elapsed * 1000:.0f}ms{self.SUFFIXES[profile.format]}"
+        title = f"{profile.route} ({profile.elapsed * 1000:.0f} ms, {profile.reason})"
+        data = to_speedscope(profile, title) if profile.format == "speedscope" else to_collapsed(profile)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, name), "wb") as f:
+                f.write(data)
+            for old in self.list()[self.max_files:]:
+                try:
+                    os.remove(os.path.join(self.directory, old["name"]))
+                except OSError:
+                    pass
+        return name
+
+    def list(self) -> list:
+        """Newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if self.NAME_PATTERN.match(name) and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append({"name": name, "size": stat.st_size, "created_at": datetime.utcfromtimestamp(stat.st_mtime).isoformat()})
+        return sorted(entries, key=lambda e: e["name"], reverse=True)
+
+    def path_for(self, name: str):
+        """Absolute path of a stored profile, or None (names are never used as raw paths)"""
+        if not self.NAME_PATTERN.match(name) or name not in {e["name"] for e in self.list()}:
+            return None
+        return os.path.join(self.directory, name)
+
+
+# Global profile store
+profile_store = ProfileStore()
+
+
+def _is_admin_request(scope) -> bool:
+    authorization = b""
+    for key, value in scope.get("headers", []):
+        if key == b"authorization":
+            authorization = value
+    authorization = authorization.decode("latin-1")
+    if not authorization.startswith("Bearer "):
+        return False
+    email = auth.get_user_from_token(authorization[7:])
+    if not email:
+        return False
+    db = database.SessionLocal()
+    try:
+        return bool(db.query(models.User.is_admin).filter(models.User.email == email).scalar())
+    finally:
+        db.close()
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when an admin sends `X-Profile: speedscope|collapsed`
+    (or `1`), or for a random PROFILE_SAMPLE_RATE fraction of traffic.
+    The saved file name is returned in the `X-Profile-Id` response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _requested_format(self, scope):
+        for key, value in scope.get("headers", []):
+            if key == PROFILE_HEADER:
+                value = value.decode("latin-1").strip().lower()
+                return value if value in FORMATS else "speedscope"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        fmt = self._requested_format(scope)
+        reason = None
+        if fmt is not None:
+            if await run_in_threadpool(_is_admin_request, scope):
+                reason = "requested"
+            else:
+                fmt = None
+        if fmt is None and PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            fmt, reason = "speedscope", "sampled"
+        if fmt is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(fmt, reason)
+        token = _active.set(profile)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start" and profile.samples:
+                profile.route = getattr(scope.get("route"), "path", scope["path"])
+                profile.elapsed = time.perf_counter() - profile.started
+                name = await run_in_threadpool(profile_store.save, profile)
+                logger.info("🔬 Profile saved: %s (%s samples)", name, len(profile.samples))
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", name.encode("ascii"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _active.reset(token)
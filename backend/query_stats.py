@@ -0,0 +1,169 @@
+"""
+Query Stats Module
+Request-scoped SQL instrumentation: query count and DB time per request, slow-query log, N+1 detection
+"""
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from sqlalchemy import event
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "1") == "1"
+# Statements slower than this are logged with their parameters and route
+SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+# The same statement this many times in one request is reported as a possible N+1
+REPEATED_QUERY_THRESHOLD = int(os.getenv("SQL_REPEATED_QUERY_THRESHOLD", "5"))
+# Adds "Server-Timing: db;dur=...;desc=..." to responses (exposes timings, off by default)
+SERVER_TIMING = os.getenv("SQL_SERVER_TIMING", "0") == "1"
+
+MAX_LOGGED_STATEMENT = 500
+MAX_LOGGED_PARAMETERS = 300
+# Label for requests that matched no route (raw paths would make label cardinality unbounded)
+UNMATCHED_ROUTE = "<unmatched>"
+
+db_queries_per_request = metrics.registry.histogram(
+    "db_queries_per_request", "SQL statements executed per request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+db_seconds_per_request = metrics.registry.histogram(
+    "db_seconds_per_request", "Time spent in SQL statements per request", ("route",))
+db_slow_queries = metrics.registry.counter(
+    "db_slow_queries", "Statements slower than SQL_SLOW_QUERY_MS", ("route",))
+
+
+def _short(value, limit: int) -> str:
+    text = str(value)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def route_of(scope) -> str:
+    """Route template of the request (as metrics._route_template), never the raw path"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class QueryStats:
+    """SQL activity of one request (shared by the threads that serve it)"""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.identical = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def route(self) -> str:
+        return route_of(self.scope)
+
+    def record(self, statement: str, parameters, executemany: bool, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            self.statements[statement] += 1
+            if not executemany:
+                self.identical[(statement, repr(parameters))] += 1
+
+    def repeated(self) -> list:
+        """Statements run at least REPEATED_QUERY_THRESHOLD times (N+1 candidates)"""
+        return [(s, n) for s, n in self.statements.items() if n >= REPEATED_QUERY_THRESHOLD]
+
+    def duplicates(self) -> list:
+        """Statements run more than once with the very same parameters"""
+        return [(s, p, n) for (s, p), n in self.identical.items() if n > 1]
+
+    def report(self):
+        route = self.route
+        if route != UNMATCHED_ROUTE:
+            db_queries_per_request.labels(route).observe(self.count)
+            db_seconds_per_request.labels(route).observe(self.seconds)
+        for statement, count in self.repeated():
+            logger.warning("🔁 Possible N+1 on %s: %sx %s", route, count, _short(statement, MAX_LOGGED_STATEMENT))
+        for statement, parameters, count in self.duplicates():
+            logger.warning(
+                "♻️ Duplicate query on %s: %sx %s | params=%s",
+                route, count, _short(statement, MAX_LOGGED_STATEMENT), _short(parameters, MAX_LOGGED_PARAMETERS),
+            )
+        if self.count:
+            logger.debug("🗄️ %s: %s queries, %.1fms in DB", route, self.count, self.seconds * 1000)
+
+
+_current = ContextVar("query_stats", default=None)
+
+
+def current():
+    """QueryStats of the request being served, or None outside requests"""
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, parameters, executemany, seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        route = stats.route if stats is not None else "-"
+        db_slow_queries.labels(route).inc()
+        logger.warning(
+            "🐢 Slow query (%.0fms) on %s: %s | params=%s",
+            seconds * 1000, route, _short(statement, MAX_LOGGED_STATEMENT), _short(parameters, MAX_LOGGED_PARAMETERS),
+        )
+
+
+def _handle_error(exception_context):
+    # The statement failed: drop its start time so the stack stays balanced
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+def instrument(engine):
+    """Attach the cursor-execute hooks to `engine`"""
+    if engine is None or not SQL_INSTRUMENTATION:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class QueryStatsMiddleware:
+    """
+    Opens a QueryStats collector for each HTTP request. It lives in a
+    ContextVar, so it follows the request into threadpool handlers,
+    dependencies and the serialized writer (which copies the caller's context).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_INSTRUMENTATION:
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope)
+        token = _current.set(stats)
+
+        async def send_with_timing(message):
+            if SERVER_TIMING and message["type"] == "http.response.start":
+                timing = f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode("ascii"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            stats.report()
@@ -0,0 +1,38 @@
+"""
+Responses Module
+Fast JSON response helpers (orjson when installed, pydantic-core for models)
+"""
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: orjson encoding, stdlib json as fallback"""
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def model_response(model: BaseModel, status_code: int = 200, headers: dict = None) -> Response:
+    """
+    Serialize an already validated pydantic model straight to JSON bytes
+    (pydantic-core), skipping FastAPI's response_model round trip.
+    """
+    return Response(
+        content=model.model_dump_json(),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json"
+    )
+
+
+def raw_json_response(content: bytes, status_code: int = 200, headers: dict = None) -> Response:
+    """Pass JSON bytes from an upstream service through without decoding them"""
+    return Response(content=content, status_code=status_code, headers=headers, media_type="application/json")
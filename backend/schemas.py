@@ -56,9 +56,56 @@ class UsersList(BaseModel):
     total: int
     skip: int
     limit: int
+    next_cursor: Optional[int] = None
     users: list[User]
 
+class UserFilter(BaseModel):
+    is_active: Optional[bool] = None
+    is_premium: Optional[bool] = None
+    is_admin: Optional[bool] = None
+    email_verified: Optional[bool] = None
+    created_before: Optional[datetime] = None
+    older_than_days: Optional[int] = None
+
+class BulkUserSelection(BaseModel):
+    ids: Optional[list[int]] = None
+    filter: Optional[UserFilter] = None
+
+class BulkUserUpdate(BulkUserSelection):
+    patch: UserUpdate
+
+class BulkOperationResult(BaseModel):
+    success: bool
+    affected: int
+
+class BulkImportRow(BaseModel):
+    row: int
+    email: Optional[str] = None
+    status: str # 'created', 'duplicate', 'invalid'
+    detail: Optional[str] = None
+
+class BulkImportReport(BaseModel):
+    total: int
+    created: int
+    duplicates: int
+    invalid: int
+    rows: list[BulkImportRow]
+
 class BroadcastRequest(BaseModel):
     subject: str
     message: str
     target: str # 'all', 'premium', 'admin'
+
+class BroadcastJobStatus(BaseModel):
+    job_id: str
+    status: str # 'queued', 'running', 'completed', 'failed'
+    subject: str
+    target: str
+    total: int
+    sent: int
+    failed: int
+    pending: int
+    failed_recipients: list[str] = []
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
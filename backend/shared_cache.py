@@ -0,0 +1,268 @@
+"""
+Shared Cache Module
+Cross-process cache store on a local SQLite file in WAL mode: every uvicorn worker on the host
+sees the same entries, with atomic get / set / compare-and-set, TTL expiry and a size cap
+"""
+import os
+import json
+import secrets
+import time
+import sqlite3
+import logging
+import threading
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "./shared_cache.db")
+# Upper bound on entries per namespace when the cache does not set its own
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "10000"))
+SHARED_CACHE_BUSY_TIMEOUT_MS = int(os.getenv("SHARED_CACHE_BUSY_TIMEOUT_MS", "2000"))
+# Expired rows are purged every this many writes per namespace and process
+# (the size cap is checked on every write, against the trigger-maintained count)
+EVICT_EVERY_WRITES = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_cache_entries_updated ON cache_entries (namespace, updated_at);
+CREATE TABLE IF NOT EXISTS cache_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires_at REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cache_sizes (
+    namespace TEXT PRIMARY KEY,
+    entries INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS cache_entries_inserted AFTER INSERT ON cache_entries BEGIN
+    INSERT INTO cache_sizes (namespace, entries) VALUES (new.namespace, 1)
+    ON CONFLICT (namespace) DO UPDATE SET entries = cache_sizes.entries + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_deleted AFTER DELETE ON cache_entries BEGIN
+    UPDATE cache_sizes SET entries = entries - 1 WHERE namespace = old.namespace;
+END;
+INSERT OR IGNORE INTO cache_sizes (namespace, entries)
+    SELECT namespace, COUNT(*) FROM cache_entries GROUP BY namespace;
+"""
+
+
+def encode(value) -> bytes:
+    """Values are stored as JSON (sorted keys, so equal values compare equal in SQL)"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def as_stored(value):
+    """`value` as the store will return it (JSON round trip)"""
+    return json.loads(encode(value))
+
+
+def encode_key(key) -> str:
+    return key if isinstance(key, str) else json.dumps(key, sort_keys=True, default=str)
+
+
+class SQLiteSharedStore:
+    """
+    One SQLite connection per thread (SQLite connections are not shared across
+    threads), WAL so readers never wait for a writer, synchronous=NORMAL since
+    losing the last writes on power loss only costs cache misses.
+    Times are wall-clock (time.time()) because processes do not share a monotonic clock.
+    """
+
+    def __init__(self, path: str = SHARED_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.errors = 0
+        self._epoch = None
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=SHARED_CACHE_BUSY_TIMEOUT_MS / 1000)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key):
+        """(value, expires_at) or None when absent / expired"""
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, encode_key(key), time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, namespace: str, key, value, ttl: float = None, max_entries: int = None):
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO cache_entries (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, "
+            "expires_at = excluded.expires_at, updated_at = excluded.updated_at",
+            (namespace, encode_key(key), encode(value), now + ttl if ttl is not None else None, now),
+        )
+        self._after_write(namespace, max_entries)
+
+    def compare_and_set(self, namespace: str, key, expected, value, ttl: float = None, max_entries: int = None) -> bool:
+        """
+        Atomically replace the value only if it currently equals `expected`
+        (`expected=None`: only if the key is absent or expired).
+        """
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        conn = self._connection()
+        if expected is None:
+            cursor = conn.execute(
+                "INSERT INTO cache_entries (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, "
+                "expires_at = excluded.expires_at, updated_at = excluded.updated_at "
+                "WHERE cache_entries.expires_at IS NOT NULL AND cache_entries.expires_at <= ?",
+                (namespace, encode_key(key), encode(value), expires_at, now, now),
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE cache_entries SET value = ?, expires_at = ?, updated_at = ? "
+                "WHERE namespace = ? AND key = ? AND value = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (encode(value), expires_at, now, namespace, encode_key(key), encode(expected), now),
+            )
+        if cursor.rowcount == 1:
+            self._after_write(namespace, max_entries)
+            return True
+        return False
+
+    def delete(self, namespace: str, key):
+        self._connection().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, encode_key(key))
+        )
+
+    def clear(self, namespace: str):
+        self._connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+
+    def count(self, namespace: str) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (namespace,)
+        ).fetchone()[0]
+
+    def size(self, namespace: str) -> int:
+        """Entry count kept by the cache_entries triggers (one primary key lookup, unlike count())"""
+        row = self._connection().execute(
+            "SELECT entries FROM cache_sizes WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def note_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def _after_write(self, namespace: str, max_entries: int = None):
+        max_entries = max_entries or SHARED_CACHE_MAX_ENTRIES
+        with self._lock:
+            writes = self._writes.get(namespace, 0) + 1
+            self._writes[namespace] = writes % EVICT_EVERY_WRITES
+        if writes >= EVICT_EVERY_WRITES or self.size(namespace) > max_entries:
+            self.evict(namespace, max_entries)
+
+    def evict(self, namespace: str, max_entries: int):
+        """
+        Drops expired entries, then the least recently written beyond `max_entries`,
+        and resynchronizes the namespace's tracked size with its real count
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, time.time()),
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache_entries WHERE namespace = ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (namespace, namespace, max_entries),
+            ).rowcount
+            conn.execute(
+                "INSERT INTO cache_sizes (namespace, entries) "
+                "SELECT ?, COUNT(*) FROM cache_entries WHERE namespace = ? "
+                "ON CONFLICT (namespace) DO UPDATE SET entries = excluded.entries",
+                (namespace, namespace),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        with self._lock:
+            self.evictions += removed
+
+    def bump_version(self, name: str, ttl: float = None) -> int:
+        """
+        Set counter `name` to the next value of one store-wide sequence, so a
+        version is never reused, even by a counter that expired and restarted.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute(
+                "INSERT INTO cache_counters (name, value) VALUES ('#sequence', 1) "
+                "ON CONFLICT (name) DO UPDATE SET value = cache_counters.value + 1 RETURNING value"
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO cache_counters (name, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (name, version, now + ttl if ttl is not None else None),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return version
+
+    def epoch(self) -> int:
+        """
+        Random id of this store, created with it and the same in every process.
+        Versions only restart when the store does, and then so does the epoch.
+        """
+        if self._epoch is None:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO cache_counters (name, value) VALUES ('#epoch', ?) ON CONFLICT (name) DO NOTHING",
+                (secrets.randbits(62),),
+            )
+            self._epoch = conn.execute("SELECT value FROM cache_counters WHERE name = '#epoch'").fetchone()[0]
+        return self._epoch
+
+    def version(self, name: str):
+        """Current value of counter `name`, or None if unset / expired"""
+        row = self._connection().execute(
+            "SELECT value FROM cache_counters WHERE name = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (name, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+
+# Global shared store (the SQLite file is opened lazily, per thread)
+shared_store = SQLiteSharedStore()
+
+
+def collect_metrics():
+    """Eviction and error counters of the shared store (see metrics.Registry)"""
+    yield "shared_cache_evictions", "counter", "Entries evicted from the shared cache by this process", [
+        ("_total", {}, shared_store.evictions)
+    ]
+    yield "shared_cache_errors", "counter", "Shared cache operations that failed (served as misses)", [
+        ("_total", {}, shared_store.errors)
+    ]
+
+
+metrics.registry.add_collector(collect_metrics)
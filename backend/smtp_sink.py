@@ -0,0 +1,99 @@
+"""
+Local SMTP sink for development and load tests.
+Accepts (and discards) every message, advertising AUTH so EmailService can log in.
+Recipients passed as `reject` are refused (550), to exercise failure paths.
+
+Usage:
+    python smtp_sink.py [port]
+Then run the API with:
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=2525 SMTP_STARTTLS=false SMTP_PASSWORD=sink
+"""
+import sys
+import threading
+import socketserver
+
+
+class SinkStats:
+    def __init__(self):
+        self.connections = 0
+        self.logins = 0
+        self.messages = 0
+        self.recipients = []
+        self._lock = threading.Lock()
+
+    def add(self, field: str, amount: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        stats = self.server.stats
+        stats.add("connections")
+        self.reply("220 smtp-sink ready")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb == "EHLO":
+                self.reply("250-smtp-sink")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 OK")
+            elif verb == "HELO":
+                self.reply("250 smtp-sink")
+            elif verb == "AUTH":
+                stats.add("logins")
+                self.reply("235 Authentication successful")
+            elif verb == "RCPT":
+                recipient = command.split(":", 1)[-1].strip(" <>")
+                if recipient in self.server.reject:
+                    self.reply("550 No such user")
+                    continue
+                with stats._lock:
+                    stats.recipients.append(recipient)
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                stats.add("messages")
+                self.reply("250 OK queued")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                # MAIL, RSET, NOOP, ...
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 2525, reject=()):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.stats = SinkStats()
+        self.reject = set(reject)
+
+    def start_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 2525
+    sink = SMTPSink(port=port)
+    print(f"SMTP sink listening on 127.0.0.1:{port} (Ctrl+C to stop)")
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nConnections: {sink.stats.connections} | Logins: {sink.stats.logins} | Messages: {sink.stats.messages}")
@@ -0,0 +1,46 @@
+"""
+Startup Profile Module
+Times the cold-start phases (imports, migrations, pool warm-up) for the boot report
+"""
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.steps = []
+
+    def checkpoint(self, name: str):
+        """Record the time elapsed since the previous checkpoint/step"""
+        now = time.perf_counter()
+        self.steps.append((name, now - self._last))
+        self._last = now
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+            self._last = time.perf_counter()
+
+    def report(self) -> dict:
+        return {
+            "steps_ms": {name: round(seconds * 1000, 1) for name, seconds in self.steps},
+            "total_ms": round((self._last - self.started) * 1000, 1),
+        }
+
+    def log_report(self):
+        report = self.report()
+        steps = " | ".join(f"{name} {ms}ms" for name, ms in report["steps_ms"].items())
+        logger.info("⏱️ Startup profile: %s | total %sms", steps, report["total_ms"])
+
+
+# Created when main.py starts importing, so "imports" covers module loading
+startup_profile = StartupProfile()
@@ -0,0 +1,251 @@
+"""
+Structured Logging Module
+Non-blocking logging pipeline: records are queued by the request threads and formatted / written
+as JSON lines by a background thread, tagged with the request id, with per-logger sampling
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from contextvars import ContextVar
+import metrics
+import tracing
+
+# 'json' (one object per line) or 'text' (human readable, for local development)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Records beyond this many waiting for the writer are dropped (and counted), never blocked on
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# "logger=rate,..." keeps that fraction of a logger's (and its children's) records below WARNING
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "main.visits=0.05")
+# Route uvicorn's own loggers (access log included) through the queue as well
+LOG_CAPTURE_UVICORN = os.getenv("LOG_CAPTURE_UVICORN", "1") == "1"
+REQUEST_ID_HEADER = b"x-request-id"
+MAX_REQUEST_ID_LENGTH = 64
+
+# Arguments of these types are safe to format later on the writer thread;
+# anything else (ORM rows, mutable containers) is formatted by the caller
+LAZY_ARG_TYPES = (str, int, float, bool, type(None))
+
+# Attributes every LogRecord has; anything else came from `extra=` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "trace_id", "sample_rate",
+}
+
+_request_id = ContextVar("request_id", default=None)
+
+
+def current_request_id():
+    """Id of the request being served, or None outside requests"""
+    return _request_id.get()
+
+
+def parse_sampling(spec: str) -> dict:
+    rates = {}
+    for item in spec.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the records of chatty loggers (most specific name wins).
+    WARNING and above always pass; kept records carry their sample_rate so
+    counts can be scaled back up downstream.
+    """
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+        self._cache = {}
+
+    def rate_for(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate, candidate = 1.0, name
+            while candidate:
+                if candidate in self.rates:
+                    rate = self.rates[candidate]
+                    break
+                candidate = candidate.rpartition(".")[0]
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Runs on the logging thread: stamps the request / trace ids (they live in
+    ContextVars, so they must be read here) and enqueues without formatting
+    when the arguments are plain values. A full queue drops the record.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.request_id = _request_id.get()
+        record.trace_id = tracing.current_trace_id()
+        args = record.args
+        if args and not all(isinstance(a, LAZY_ARG_TYPES) for a in (args.values() if isinstance(args, dict) else args)):
+            record.msg, record.args = record.getMessage(), None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("request_id", "trace_id", "sample_rate"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record) -> str:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = "-"
+        return super().format(record)
+
+
+_handler = None
+_listener = None
+
+
+def configure():
+    """
+    Installs the queue pipeline on the root logger (idempotent, replaces
+    logging.basicConfig). The writer thread is flushed at interpreter exit.
+    """
+    global _handler, _listener
+    if _handler is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+
+    _handler = ContextQueueHandler(log_queue)
+    _handler.addFilter(SamplingFilter(parse_sampling(LOG_SAMPLING)))
+    _listener = logging.handlers.QueueListener(log_queue, output)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+
+    if LOG_CAPTURE_UVICORN:
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            for handler in list(uvicorn_logger.handlers):
+                uvicorn_logger.removeHandler(handler)
+            uvicorn_logger.propagate = True
+
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Stops the writer thread after it has written everything queued"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def collect_metrics():
+    """Prometheus families for the logging queue (see metrics.Registry)"""
+    if _handler is None:
+        return
+    yield "log_queue_depth", "gauge", "Log records waiting for the writer thread", [
+        ("", {}, _handler.queue.qsize())
+    ]
+    yield "log_records_dropped", "counter", "Log records dropped because the queue was full", [
+        ("_total", {}, _handler.dropped)
+    ]
+
+
+metrics.registry.add_collector(collect_metrics)
+
+
+def _valid_request_id(value: str) -> bool:
+    # ASCII only: str.isalnum() also accepts letters like "é", which cannot be echoed in a header
+    return 0 < len(value) <= MAX_REQUEST_ID_LENGTH and all(
+        c.isascii() and (c.isalnum() or c in "-_.:") for c in value
+    )
+
+
+class RequestIdMiddleware:
+    """
+    Gives every HTTP request an id for its log records: the caller's
+    `X-Request-Id` when well-formed, else the trace id, else a random one.
+    It is echoed in the `X-Request-Id` response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope.get("headers", []):
+            if key == REQUEST_ID_HEADER:
+                value = value.decode("latin-1").strip()
+                if _valid_request_id(value):
+                    request_id = value
+                break
+        request_id = request_id or tracing.current_trace_id() or os.urandom(8).hex()
+        encoded = request_id.encode("ascii")
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, encoded)]
+            await send(message)
+
+        token = _request_id.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            _request_id.reset(token)
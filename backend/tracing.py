@@ -0,0 +1,382 @@
+"""
+Tracing Module
+Lightweight in-process spans (request, middleware, dependencies, SQL, upstream calls, SMTP)
+exported as NDJSON or OTLP/HTTP JSON, with W3C traceparent propagation
+"""
+import os
+import json
+import time
+import queue
+import random
+import inspect
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# '' (off), 'ndjson' (TRACE_FILE) or 'otlp' (TRACE_OTLP_ENDPOINT)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "./traces.ndjson")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "electromatics-backend")
+TRACE_QUEUE_SIZE = 10000
+TRACE_BATCH_SIZE = 512
+TRACE_FLUSH_SECONDS = 1.0
+MAX_STATEMENT_LENGTH = 300
+
+TRACING_ENABLED = TRACE_EXPORTER in ("ndjson", "otlp")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, kind: str = "internal", attributes: dict = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, error: BaseException = None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"[:300]
+        exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current = ContextVar("current_span", default=None)
+
+
+def current_span():
+    return _current.get()
+
+
+def current_trace_id():
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+def start_span(name: str, kind: str = "internal", **attributes):
+    """Child of the current span, or None when no trace is active (not activated)"""
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """
+    Child span around a block (no-op outside traced requests).
+    Yields the span (or None) so callers can add attributes.
+    """
+    child = start_span(name, kind, **attributes)
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        _current.reset(token)
+        child.end(e)
+        raise
+    _current.reset(token)
+    child.end()
+
+
+def traced_dependency(fn):
+    """
+    Span around a FastAPI dependency. Generator dependencies (get_db) are
+    entered and closed on different threads, so their span is not activated;
+    it measures how long the dependency stays open.
+    """
+    if not TRACING_ENABLED:
+        return fn
+    name = f"dependency {fn.__name__}"
+
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def generator_wrapper(*args, **kwargs):
+            child = start_span(name)
+            error = None
+            try:
+                yield from fn(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                if child is not None:
+                    child.end(error)
+        return generator_wrapper
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def sync_wrapper(*args, **kwargs):
+        with span(name):
+            return fn(*args, **kwargs)
+    return sync_wrapper
+
+
+def traced_middleware(middleware_class):
+    """Subclass of a pure ASGI middleware whose calls are wrapped in a span"""
+    if not TRACING_ENABLED:
+        return middleware_class
+    name = f"middleware {middleware_class.__name__}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await middleware_class.__call__(self, scope, receive, send)
+            return
+        with span(name):
+            await middleware_class.__call__(self, scope, receive, send)
+
+    return type(middleware_class.__name__, (middleware_class,), {"__call__": __call__})
+
+
+# --- SQL -------------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    child = start_span("db.query", kind="client", statement=statement[:MAX_STATEMENT_LENGTH])
+    conn.info.setdefault("trace_spans", []).append(child)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    child = spans.pop() if spans else None
+    if child is not None:
+        child.set("rows", cursor.rowcount)
+        child.end()
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    spans = conn.info.get("trace_spans") if conn is not None else None
+    child = spans.pop() if spans else None
+    if child is not None:
+        child.end(exception_context.original_exception)
+
+
+def instrument(engine):
+    """Attach SQL statement spans to `engine`"""
+    if engine is None or not TRACING_ENABLED:
+        return
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# --- Export ----------------------------------------------------------------
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+def to_otlp(spans: list) -> dict:
+    """OTLP/HTTP JSON ExportTraceServiceRequest"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": "electromatics.tracing"},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": OTLP_KINDS.get(s.kind, 1),
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+class SpanExporter:
+    """
+    Finished spans go to a bounded queue; a background thread writes them in
+    batches (NDJSON lines or OTLP/HTTP JSON posts). Spans are dropped, never
+    blocked on, when the queue is full.
+    """
+
+    def __init__(self, mode: str = TRACE_EXPORTER):
+        self.mode = mode
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def export(self, finished: Span):
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> list:
+        batch = []
+        while len(batch) < TRACE_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list):
+        if self.mode == "ndjson":
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(s.to_dict()) + "\n" for s in batch))
+        elif self.mode == "otlp":
+            import urllib.request
+            request = urllib.request.Request(
+                TRACE_OTLP_ENDPOINT,
+                data=json.dumps(to_otlp(batch)).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+
+    def flush(self):
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.warning("⚠️ Trace export failed (%s spans dropped): %s", len(batch), e)
+
+    def _run(self):
+        while not self._stop.wait(TRACE_FLUSH_SECONDS):
+            self.flush()
+
+    def start(self):
+        if not TRACING_ENABLED or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        logger.info("🧵 Tracing enabled (%s)", self.mode)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=TRACE_FLUSH_SECONDS + 5)
+            self._thread = None
+        self.flush()
+
+
+# Global exporter instance
+exporter = SpanExporter()
+
+
+def parse_traceparent(value: str):
+    """(trace_id, parent_span_id, sampled) from a W3C traceparent header, or None"""
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+class TracingMiddleware:
+    """
+    Root span per HTTP request. Continues an incoming W3C `traceparent`
+    (honouring its sampled flag) or starts a trace for TRACE_SAMPLE_RATE of
+    requests, and returns `traceparent` / `X-Trace-Id` response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                incoming = parse_traceparent(value.decode("latin-1"))
+                break
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATE
+
+        root = Span(f"{scope['method']} {scope['path']}", trace_id, parent_id, kind="server",
+                    attributes={"http.method": scope["method"], "http.target": scope["path"]})
+        traceparent = f"00-{trace_id}-{root.span_id}-{'01' if sampled else '00'}".encode("ascii")
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                root.set("http.status_code", message["status"])
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"traceparent", traceparent),
+                    (b"x-trace-id", trace_id.encode("ascii")),
+                ]
+            await send(message)
+
+        if not sampled:
+            await self.app(scope, receive, send_with_trace)
+            return
+
+        token = _current.set(root)
+        error = None
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.name = f"{scope['method']} {route}"
+                root.set("http.route", route)
+            root.end(error)
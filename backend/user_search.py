@@ -0,0 +1,161 @@
+"""
+User Search Module
+Indexed search, keyset pagination, set-based filters and cached totals for the admin user list
+"""
+import os
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import text, func, or_
+from sqlalchemy.orm import Session
+import models
+from cache import make_cache, payload_versions
+
+logger = logging.getLogger(__name__)
+
+# Trigram matching needs at least 3 characters; shorter terms fall back to LIKE
+MIN_INDEXED_TERM_LENGTH = 3
+
+# Totals are shown for orientation only, so a few seconds of staleness is fine
+user_count_cache = make_cache(ttl=float(os.getenv("USER_COUNT_CACHE_SECONDS", "30")), max_entries=256, name="user_count")
+
+# Whether the SQLite FTS5 table exists (checked once, lazily)
+_sqlite_fts_enabled = None
+
+SQLITE_FTS_STATEMENTS = [
+    """CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts(rowid, email, full_name) VALUES (new.id, new.email, new.full_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, email, full_name) VALUES ('delete', old.id, old.email, old.full_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF email, full_name ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, email, full_name) VALUES ('delete', old.id, old.email, old.full_name);
+        INSERT INTO users_fts(rowid, email, full_name) VALUES (new.id, new.email, new.full_name);
+    END""",
+]
+
+POSTGRES_TRGM_STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_full_name_trgm ON users USING gin (full_name gin_trgm_ops)",
+]
+
+
+def create_search_indexes(conn):
+    """
+    Creates the search index for users.email / users.full_name (run as a migration).
+    PostgreSQL: pg_trgm GIN indexes (used directly by ILIKE '%term%').
+    SQLite: an FTS5 trigram table kept in sync with triggers.
+    """
+    global _sqlite_fts_enabled
+    if conn.dialect.name == "postgresql":
+        try:
+            with conn.begin_nested():
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                for statement in POSTGRES_TRGM_STATEMENTS:
+                    conn.execute(text(statement))
+            logger.info("✅ Trigram search indexes ready on users")
+        except Exception as e:
+            # e.g. no permission for CREATE EXTENSION; search keeps working through ILIKE scans
+            logger.warning("⚠️ Could not create trigram search indexes: %s", e)
+    elif conn.dialect.name == "sqlite":
+        try:
+            with conn.begin_nested():
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+                ).first()
+                if not exists:
+                    conn.execute(text(
+                        "CREATE VIRTUAL TABLE users_fts USING fts5("
+                        "email, full_name, content='users', content_rowid='id', tokenize='trigram')"
+                    ))
+                    conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+                for statement in SQLITE_FTS_STATEMENTS:
+                    conn.execute(text(statement))
+            logger.info("✅ FTS5 search index ready on users")
+        except Exception as e:
+            # e.g. SQLite built without FTS5 or the trigram tokenizer (< 3.34); search keeps working through LIKE scans
+            logger.warning("⚠️ Could not create the FTS5 search index: %s", e)
+        _sqlite_fts_enabled = None
+
+
+def sqlite_fts_enabled(db: Session) -> bool:
+    global _sqlite_fts_enabled
+    if _sqlite_fts_enabled is None:
+        _sqlite_fts_enabled = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+        ).first() is not None
+    return _sqlite_fts_enabled
+
+
+def apply_search(query, db: Session, search: str):
+    """Filter a User query by a substring of email or full name"""
+    if not search:
+        return query
+
+    if db.get_bind().dialect.name == "sqlite" and len(search) >= MIN_INDEXED_TERM_LENGTH and sqlite_fts_enabled(db):
+        # Quoted phrase = case-insensitive substring match with the trigram tokenizer
+        phrase = '"' + search.replace('"', '""') + '"'
+        return query.filter(models.User.id.in_(
+            text("SELECT rowid FROM users_fts WHERE users_fts MATCH :phrase").bindparams(phrase=phrase)
+        ))
+
+    search_filter = f"%{search}%"
+    return query.filter(or_(
+        models.User.email.ilike(search_filter),
+        models.User.full_name.ilike(search_filter)
+    ))
+
+
+def invalidate_user_caches():
+    """Drop every cached value derived from the users table"""
+    user_count_cache.clear()
+    payload_versions.bump("users")
+
+
+def user_filter_conditions(ids: list = None, user_filter=None) -> list:
+    """
+    Builds SQL conditions selecting users by explicit ids and/or a schemas.UserFilter.
+    Returns an empty list when nothing was specified.
+    """
+    conditions = []
+    if ids:
+        conditions.append(models.User.id.in_(ids))
+
+    if user_filter is not None:
+        for field in ("is_active", "is_premium", "is_admin", "email_verified"):
+            value = getattr(user_filter, field)
+            if value is not None:
+                conditions.append(getattr(models.User, field) == value)
+        if user_filter.created_before is not None:
+            conditions.append(models.User.created_at < user_filter.created_before)
+        if user_filter.older_than_days is not None:
+            cutoff = datetime.utcnow() - timedelta(days=user_filter.older_than_days)
+            conditions.append(models.User.created_at < cutoff)
+
+    return conditions
+
+
+def count_users(db: Session, search: str = None) -> int:
+    """Cached total of users matching `search`"""
+    def compute():
+        return apply_search(db.query(func.count(models.User.id)), db, search).scalar() or 0
+
+    return user_count_cache.get_or_set(search or "", compute)
+
+
+def page_users(db: Session, limit: int, cursor: int = None, skip: int = 0, search: str = None):
+    """
+    Returns (users, next_cursor), newest first.
+    With `cursor` the page starts right after that id (keyset); otherwise `skip` is used.
+    """
+    query = apply_search(db.query(models.User), db, search)
+    if cursor is not None:
+        query = query.filter(models.User.id < cursor)
+    query = query.order_by(models.User.id.desc())
+    if cursor is None and skip:
+        query = query.offset(skip)
+
+    rows = query.limit(limit + 1).all()
+    users = rows[:limit]
+    next_cursor = users[-1].id if len(rows) > limit and users else None
+    return users, next_cursor